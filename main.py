@@ -10,15 +10,22 @@ from raincollector.models.account import AccountWindow
 from raincollector.models.window import pygetWindow
 from raincollector.models.websocket_client import Websocket_client
 from raincollector.humanizer import BehaviorController
-from raincollector.utils.vision import DetectionModel
+from raincollector.utils.model_loader import load_detection_model
 from raincollector.main.rain_controller import RainController
 
 plogging = Plogging()
-plogging.set_websocket_settings(False, False, False, False)
-plogging.set_folders(info='logs', error='logs', warn='logs', debug='logs')
-plogging.enable_logging()
 
-yolo_model = DetectionModel("best.pt", plogging)
+
+def setup_logging():
+    """
+    Настраивает и включает журнал. Вызывается только при запуске приложения: процессы пула инференса
+    (spawn) импортируют этот модуль заново и не должны создавать свои файлы журнала и архивировать чужие.
+    """
+    plogging.set_websocket_settings(False, False, False, False)
+    plogging.set_folders(info='logs', error='logs', warn='logs', debug='logs')
+    # Входящие кадры расширений логируются на каждое сообщение - ограничиваем поток строк
+    plogging.set_rate_limit("WS", rate=20, burst=50)
+    plogging.enable_logging()
 
 
 async def open_browsers():
@@ -74,6 +81,7 @@ async def pair_window(client: Websocket_client, paired_accounts: list[AccountWin
 
 
 def _main():
+    setup_logging()
     #running async main
     asyncio.run(main())
     
@@ -82,6 +90,14 @@ async def main():
     plogging.info("[MAIN] 🚀 Запуск приложения...")
     
     try:
+        # Модель загружается и прогревается в фоне, пока открываются браузеры и подключаются расширения.
+        # backend: "pt", "onnx", "openvino", "openvino-int8" - артефакт готовится командой
+        # python -m raincollector.utils.model_export (без успешной проверки используется best.pt)
+        # Для разбора неудачных рейнов можно включить запись кадров с детекциями:
+        # recorder=FrameRecorder("debug_frames", logger=plogging) (raincollector.utils.frame_recorder)
+        # На многоядерной машине pool_workers=N запускает N процессов инференса с копией модели в каждом
+        yolo_model = load_detection_model("best.pt", plogging, backend="pt")
+
         plogging.info("[MAIN] Открытие браузеров...")
         await open_browsers()
         plogging.info("[MAIN] Браузеры открыты")
@@ -105,7 +121,8 @@ async def main():
         behavior_controller = BehaviorController(plogging, paired_accounts)
         
         plogging.info("[MAIN] Создание RainController...")
-        raincollector = RainController(plogging, yolo_model, paired_accounts, rain_api, behavior_controller)
+        # pipelined: если окна разложены без перекрытий, аккаунты обрабатываются конвейером
+        raincollector = RainController(plogging, yolo_model, paired_accounts, rain_api, behavior_controller, pipelined=True)
 
         # Вызываем pair_window только после получения INIT сообщения с profile_name
         plogging.info("[MAIN] Установка callback on_client_init...")
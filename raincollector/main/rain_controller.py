@@ -1,13 +1,20 @@
 import asyncio
 import time
+from typing import TYPE_CHECKING
 from raincollector.utils.plogging import Plogging
 from raincollector.models.account import AccountWindow
 from raincollector.websocket import rain_api_client
-from raincollector.utils.vision import DetectionModel
+from raincollector.utils.detections import Detections
+from raincollector.utils.detection_stream import DetectionStream
+from raincollector.utils.layout_cache import LayoutCache
 from raincollector.humanizer.humanized_move import human_moveTo, Speed
 from raincollector.humanizer import load_stats, predict_remaining_from_stats, BehaviorController
 from datetime import datetime
 
+if TYPE_CHECKING:
+    # Только для аннотаций: модуль не должен импортировать ultralytics раньше фоновой загрузки модели
+    from raincollector.utils.vision import DetectionModel
+
 # Словарь шансов сбора рейна в зависимости от времени суток и количества скрапа
 # Формат: "начало-конец": {минимальный_скрап: шанс_сбора}
 chance_to_collect_rains = {
@@ -121,10 +128,59 @@ def get_chance(scrap: float, current_time: datetime = None) -> float:
     
     return chance
 
+# Метки, которые запрашиваются у модели на разных этапах сбора
+RAIN_LABELS = ("join_rain", "rain_joined")
+CLOUDFLARE_LABELS = ("cloudflare_loading", "confirm_cloudflare")
+# Проверка запомненного положения кнопки: область вокруг рамки и уменьшенный вход модели
+LAYOUT_CHECK_MARGIN = 48
+LAYOUT_CHECK_IMGSZ = 320
+# Спекулятивное сканирование окон, пока решается, собирать ли рейн: период повторов и срок годности результата
+SPECULATIVE_INTERVAL = 2.0
+SPECULATIVE_TTL = 4.0
+
+def _regions_overlap(regions: list[tuple[int, int, int, int]]) -> bool:
+    """Проверяет, перекрывается ли хотя бы одна пара областей (left, top, width, height)."""
+    for i, (left1, top1, width1, height1) in enumerate(regions):
+        for left2, top2, width2, height2 in regions[i + 1:]:
+            if left1 < left2 + width2 and left2 < left1 + width1 and top1 < top2 + height2 and top2 < top1 + height1:
+                return True
+    return False
+
+def _expand_box(box: tuple[int, int, int, int], region: tuple[int, int, int, int], margin: int) -> tuple[int, int, int, int]:
+    """Расширяет рамку (x, y, width, height) на margin пикселей, не выходя за область окна."""
+    left = max(region[0], box[0] - margin)
+    top = max(region[1], box[1] - margin)
+    right = min(region[0] + region[2], box[0] + box[2] + margin)
+    bottom = min(region[1] + region[3], box[1] + box[3] + margin)
+    return (left, top, max(0, right - left), max(0, bottom - top))
+
+def _box_inside(box: tuple[int, int, int, int], region: tuple[int, int, int, int]) -> bool:
+    """Лежит ли рамка (x, y, width, height) целиком внутри области (left, top, width, height)."""
+    return (region[0] <= box[0] and region[1] <= box[1] and
+            box[0] + box[2] <= region[0] + region[2] and box[1] + box[3] <= region[1] + region[3])
+
 class RainController:
-    def __init__(self, logger: Plogging, yolo_model: DetectionModel, paired_accounts: list[AccountWindow], rain_api: rain_api_client, behavior_controller: BehaviorController):
+    def __init__(self, logger: Plogging, yolo_model: "DetectionModel | asyncio.Future", paired_accounts: list[AccountWindow], rain_api: rain_api_client, behavior_controller: BehaviorController, detection_rate: float = 5.0,
+                 layout_cache_path: str | None = "stats/layout_cache.json", pipelined: bool = False):
         self.plogging = logger
-        self.yolo_model = yolo_model
+        # Модель может еще загружаться (load_detection_model): тогда yolo_model - future готовности,
+        # и сбор рейна сначала ждет его в _wait_model_ready()
+        self.model_ready: asyncio.Future | None = yolo_model if isinstance(yolo_model, asyncio.Future) else None
+        self.yolo_model: "DetectionModel | None" = None if self.model_ready is not None else yolo_model
+        # Выборка детекций активного окна с частотой detection_rate; этапы сбора ждут нужный кадр через wait_for
+        self.detections = DetectionStream(self.yolo_model, logger, rate=detection_rate, labels=RAIN_LABELS)
+        # Где кнопки рейна были найдены в прошлый раз (по профилю и геометрии окна), сохраняется между запусками
+        self.layout_cache = LayoutCache(layout_cache_path)
+        # Конвейерный сбор (окна без перекрытий): пока для одного аккаунта идут клик и подтверждение,
+        # следующее окно уже сканируется. Мышь и клавиатура в каждый момент заняты только одним аккаунтом
+        self.pipelined = pipelined
+        self._input_lock = asyncio.Lock()
+        # profile_name -> (time.monotonic() начала захвата, Detections) из спекулятивного сканирования
+        self._speculative: dict = {}
+        self._speculation: asyncio.Task | None = None
+        self._speculation_valid_after = 0.0  # более ранние результаты сняты до остановки BehaviorController
+        self._speculation_scanned = 0.0      # время начала последнего завершенного сканирования
+        self._speculation_done = asyncio.Event()  # устанавливается после каждого завершенного сканирования
         self.paired_accounts = paired_accounts
         self.rain_api = rain_api
         self.current_account: AccountWindow = None
@@ -142,32 +198,138 @@ class RainController:
     def async__init__(self):    
         asyncio.create_task(self.behavior_controller.start())
         
+    async def _wait_model_ready(self) -> bool:
+        """Дожидается загрузки модели, если она еще идет. Возвращает False, если загрузка не удалась."""
+        if self.yolo_model is not None:
+            return True
+        if not self.model_ready.done():
+            self.plogging.warn("[RainController] Модель еще загружается, ожидание готовности...")
+        try:
+            self.yolo_model = await self.model_ready
+        except Exception as e:
+            self.plogging.error(f"[RainController] Модель недоступна: {e}")
+            return False
+        self.detections.model = self.yolo_model
+        return True
+
     def _set_current_rain_scrap(self, scrap: float, user_count: int):
         self.current_rain_scrap = scrap
         self.current_user_count = user_count
     
-    def _extract_coords_from_detections(self, detections: dict, target_name: str) -> tuple[int, int] | None:
+    def _extract_coords_from_detections(self, detections: Detections, target_name: str) -> tuple[int, int] | None:
         """
-        Извлекает координаты центра объекта из словаря детекций
+        Извлекает координаты центра объекта из детекций
         
         Args:
-            detections: Словарь детекций от detect_objects()
+            detections: Detections от detect_objects()
             target_name: Название объекта для поиска
             
         Returns:
-            Кортеж (center_x, center_y) или None если объект не найден
+            Кортеж (center_x, center_y) самой уверенной рамки или None если объект не найден
+        """
+        return detections.center(target_name)
+
+    def _remember_layout(self, account: AccountWindow, detections: Detections | None):
+        """Запоминает в layout_cache положения найденных кнопок рейна для окна аккаунта."""
+        region = account.window.get_region()
+        if region is None or not detections:
+            return
+        for label in RAIN_LABELS:
+            box = detections.best_box(label)
+            if box is not None:
+                self.layout_cache.put(account.extension.profile_name, region, label, box)
+
+    async def _check_cached_layout(self, account: AccountWindow) -> Detections | None:
         """
-        if target_name not in detections:
+        Проверяет кнопки рейна в запомненном месте: детекция только в небольшой области вокруг
+        прошлой рамки с уменьшенным входом модели. Возвращает детекции или None, если кэша нет
+        или кнопки на месте не оказалось (тогда запись забывается и нужен полный поиск).
+        """
+        region = account.window.get_region()
+        if region is None:
             return None
-        
-        coords = detections[target_name]
-        # Если несколько координат, берем первую
-        if isinstance(coords, list):
-            coords = coords[0]
-        x, y, width, height = coords
-        center_x = x + width // 2
-        center_y = y + height // 2
-        return (center_x, center_y)
+        profile = account.extension.profile_name
+        checked = []
+        for label in RAIN_LABELS:
+            box = self.layout_cache.get(profile, region, label)
+            if box is None:
+                continue
+            crop = _expand_box(box, region, LAYOUT_CHECK_MARGIN)
+            # join_rain и rain_joined обычно на одном месте - одну область проверяем один раз
+            if crop[2] == 0 or crop[3] == 0 or any(_box_inside(box, other) for other in checked):
+                continue
+            checked.append(crop)
+            detections = await self.yolo_model.detect_objects(region=crop, labels=RAIN_LABELS, imgsz=LAYOUT_CHECK_IMGSZ,
+                                                              profile=profile)
+            if any(found in detections for found in RAIN_LABELS):
+                self._remember_layout(account, detections)
+                return detections
+            self.layout_cache.forget(profile, label)
+        return None
+
+    async def _detect_accounts_batch(self, accounts: list[AccountWindow]) -> list[Detections] | None:
+        """
+        Детекция по окнам нескольких аккаунтов одним батчевым вызовом модели, без фокусировки окон.
+
+        Возможна только если все окна видимы и не перекрываются (разложены по экрану).
+        Иначе возвращает None, и аккаунты проверяются по очереди с фокусировкой окна.
+        """
+        if len(accounts) < 2:
+            return None
+        regions = [account.window.get_region() for account in accounts]
+        if any(region is None for region in regions) or _regions_overlap(regions):
+            return None
+        return await self.yolo_model.detect_batch(regions, labels=RAIN_LABELS,
+                                                  profiles=[account.extension.profile_name for account in accounts])
+
+    async def _speculative_scan(self):
+        """
+        Пока после rain_start идут ожидание скрапа, расчет шанса и остановка BehaviorController,
+        периодически одним батчем определяет состояние всех окон (join_rain или rain_joined).
+        Только захват экрана и детекция, без мыши и клавиатуры; окна должны быть разложены без перекрытий.
+
+        Для сбора годятся только кадры, снятые после остановки BehaviorController: более ранние сканирования
+        лишь обновляют кэш расположения кнопок. Поэтому выигрыш по времени - это сканирование после остановки,
+        выполняемое параллельно с расчетом прогноза и (если есть) дополнительным ожиданием перед сбором.
+        """
+        if not await self._wait_model_ready():
+            return
+        while True:
+            accounts = [account for account in self.paired_accounts if not account.rain_connected]
+            if self._windows_tiled(accounts):
+                started = time.monotonic()
+                results = await self.yolo_model.detect_batch(
+                    [account.window for account in accounts], labels=RAIN_LABELS,
+                    profiles=[account.extension.profile_name for account in accounts])
+                for account, detections in zip(accounts, results):
+                    self._speculative[account.extension.profile_name] = (started, detections)
+                    self._remember_layout(account, detections)
+                self._speculation_scanned = started
+                self._speculation_done.set()
+            await asyncio.sleep(SPECULATIVE_INTERVAL)
+
+    def _stop_speculation(self):
+        if self._speculation is not None:
+            self._speculation.cancel()
+            self._speculation = None
+
+    def _peek_speculative(self, account: AccountWindow) -> Detections | None:
+        """Свежий (не старше SPECULATIVE_TTL, снятый после остановки BehaviorController) результат с кнопкой рейна."""
+        entry = self._speculative.get(account.extension.profile_name)
+        if entry is None:
+            return None
+        captured, detections = entry
+        if captured < self._speculation_valid_after or time.monotonic() - captured > SPECULATIVE_TTL:
+            return None
+        if not any(label in detections for label in RAIN_LABELS):
+            return None
+        return detections
+
+    def _take_speculative(self, account: AccountWindow) -> Detections | None:
+        """Как _peek_speculative, но результат используется один раз."""
+        detections = self._peek_speculative(account)
+        self._speculative.pop(account.extension.profile_name, None)
+        return detections
 
     async def humanized_collect_rain(self):
         """
@@ -180,6 +342,12 @@ class RainController:
         if not self.paired_accounts:
             self.plogging.error("[RainController] Нет подключенных аккаунтов для сбора рейна.")
             return
+        # Пока принимается решение о сборе, окна сканируются заранее
+        self._speculative.clear()
+        self._speculation_valid_after = float("inf")
+        self._speculation_scanned = 0.0
+        self._stop_speculation()
+        self._speculation = asyncio.create_task(self._speculative_scan())
         await asyncio.sleep(3)
         while self.current_rain_scrap < 20:
             self.plogging.info("[RainController] Ожидание обновления информации о рейне (скрап < 20).")
@@ -188,8 +356,15 @@ class RainController:
         rand = random.randrange(1, 100, 1) / 100.0
         if rand > get_chance(self.current_rain_scrap):
             self.plogging.info(f"[RainController] Шанс сбора рейна не прошел (рандом {rand:.2f} > шанс {get_chance(self.current_rain_scrap):.2f}). Пропускаем сбор.")
+            self._stop_speculation()
             return
         await self.behavior_controller.stop()
+        # BehaviorController мог менять страницы - учитываются только кадры после его остановки
+        self._speculation_valid_after = time.monotonic()
+        self._speculation_done.clear()
+        # Идущее сейчас сканирование начато до остановки и будет отброшено - сразу начинаем новое
+        self._stop_speculation()
+        self._speculation = asyncio.create_task(self._speculative_scan())
         stat_param = load_stats('stats/stats.json')
         prediction_time = predict_remaining_from_stats(stat_param, 
                                                       scrap=self.current_rain_scrap,
@@ -200,37 +375,71 @@ class RainController:
             self.plogging.info(f"[RainController] Прогнозируемое время рейна {prediction_time} сек. Перед сбором ждем дополнительно {sleep_time} сек.")
             await asyncio.sleep(sleep_time)
 
+        if not await self._wait_model_ready():
+            self._stop_speculation()
+            return
+        if self.yolo_model.recorder is not None:
+            self.yolo_model.recorder.start_rain()
+
+        # Сканирование, начатое после остановки BehaviorController, уже идет - дожидаемся его (не дольше SPECULATIVE_TTL)
+        if self._speculation is not None and not self._speculation.done() and \
+                self._windows_tiled([account for account in self.paired_accounts if not account.rain_connected]):
+            if self._speculation_scanned < self._speculation_valid_after:
+                try:
+                    await asyncio.wait_for(self._speculation_done.wait(), SPECULATIVE_TTL)
+                except asyncio.TimeoutError:
+                    pass
+        self._stop_speculation()
+
+        # Если для всех окон есть свежие спекулятивные детекции, используем их; иначе, если окна разложены
+        # без перекрытий, одним батчем отмечаем аккаунты, уже присоединившиеся к рейну
+        warm = [self._peek_speculative(account) for account in self.paired_accounts]
+        if all(detections is not None for detections in warm):
+            self.plogging.info("[RainController] Используются спекулятивные детекции для всех окон.")
+            prescan = warm
+        else:
+            prescan = await self._detect_accounts_batch(self.paired_accounts)
+        if prescan:
+            for account, detections in zip(self.paired_accounts, prescan):
+                self._remember_layout(account, detections)
+                if self._extract_coords_from_detections(detections, "rain_joined"):
+                    self.plogging.info(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} уже присоединился к рейну.")
+                    account.rain_connected = True
+
+        collect_started = time.monotonic()
+        accounts = [account for account in self.paired_accounts if not account.rain_connected]
+        if self.pipelined and self._windows_tiled(accounts):
+            await self._collect_pipelined(accounts)
+            accounts = []  # неподтвержденные аккаунты повторно обрабатываются при валидации
+
         # Проходим по всем аккаунтам и пытаемся собрать рейн
-        for account in self.paired_accounts:
-            self.plogging.info(f"[RainController] Обработка аккаунта {account.extension.profile_name}.")
+        for account in accounts:
+            self.plogging.info(f"[RainController:{account.extension.profile_name}] Обработка аккаунта {account.extension.profile_name}.")
             self.current_account = account
             
             # Фокусируем окно аккаунта
             await account.window.focus_window()
             await asyncio.sleep(1)
+            # Поток не должен тратить захват и инференс на прошлое окно, пока проверяются быстрые пути
+            self.detections.stop()
             
-            # Ищем join_rain или rain_joined на странице
+            # Сначала проверяем кнопку в запомненном месте; при промахе ждем join_rain или rain_joined
+            # во всем окне (до 5 сек, продолжаем на первом подходящем кадре)
             target_coords = None
-            joined_coords = None
-            for attempt in range(5):
-                # Оптимизация: один вызов detect_objects вместо двух find_target
-                detections = await self.yolo_model.detect_objects()
-                
-                # Извлекаем координаты из детекций
-                joined_coords = self._extract_coords_from_detections(detections, "rain_joined")
-                target_coords = self._extract_coords_from_detections(detections, "join_rain")
-                
-                if joined_coords:
-                    self.plogging.info(f"[RainController] Аккаунт {account.extension.profile_name} уже присоединился к рейну.")
+            detections = self._take_speculative(account)
+            if detections is None:
+                detections = await self._check_cached_layout(account)
+            if detections is None:
+                self.detections.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+                detections = await self.detections.wait_for(any_of=RAIN_LABELS, timeout=5)
+                self._remember_layout(account, detections)
+            if detections is not None:
+                if self._extract_coords_from_detections(detections, "rain_joined"):
+                    self.plogging.info(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} уже присоединился к рейну.")
                     account.rain_connected = True
-                    break
-                    
-                if target_coords:
-                    self.plogging.info(f"[RainController] Найден join_rain для {account.extension.profile_name}. Попытка {attempt + 1}/5")
-                    break
-                    
-                await asyncio.sleep(1)
-                self.plogging.info(f"[RainController] Ожидание появления join_rain для {account.extension.profile_name}, попытка {attempt + 1}/5")
+                else:
+                    target_coords = self._extract_coords_from_detections(detections, "join_rain")
+                    self.plogging.info(f"[RainController:{account.extension.profile_name}] Найден join_rain для {account.extension.profile_name}.")
             
             # Если уже присоединен - переходим к следующему аккаунту
             if account.rain_connected:
@@ -238,29 +447,134 @@ class RainController:
                 
             # Если join_rain не найден - пробуем обновить страницу через расширение
             if not target_coords:
-                self.plogging.warn(f"[RainController] join_rain не найден для {account.extension.profile_name}. Обновляем страницу.")
+                self.plogging.warn(f"[RainController:{account.extension.profile_name}] join_rain не найден для {account.extension.profile_name}. Обновляем страницу.")
                 await account.window.refresh_page()
-                await asyncio.sleep(3)
                 
                 # Повторная попытка найти join_rain
-                detections = await self.yolo_model.detect_objects()
-                target_coords = self._extract_coords_from_detections(detections, "join_rain")
+                self.detections.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+                detections = await self.detections.wait_for(any_of=("join_rain",), timeout=3)
+                self._remember_layout(account, detections)
+                target_coords = self._extract_coords_from_detections(detections, "join_rain") if detections else None
                 if not target_coords:
-                    self.plogging.error(f"[RainController] join_rain не найден даже после обновления для {account.extension.profile_name}.")
+                    self.plogging.error(f"[RainController:{account.extension.profile_name}] join_rain не найден даже после обновления для {account.extension.profile_name}.")
                     continue
             
             # Собираем рейн с хуманизацией
             result = await self._humanized_rain_collect(account, target_coords)
             if result:
-                self.plogging.info(f"[RainController] Аккаунт {account.extension.profile_name} успешно собрал рейн.")
+                self.plogging.info(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} успешно собрал рейн.")
             else:
-                self.plogging.error(f"[RainController] Аккаунт {account.extension.profile_name} не смог собрать рейн.")
+                self.plogging.error(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} не смог собрать рейн.")
         
+        self.plogging.info("[RainController] Обход аккаунтов занял %.1f сек.", time.monotonic() - collect_started)
+
         # Валидация: проверяем, что все аккаунты получили рейн
         await self._validate_rain_collection()
+        self.detections.stop()
         
+        stats = self.yolo_model.cache_stats()
+        self.plogging.info("[RainController] Кэш детекций: попаданий %d, промахов %d (%.0f%% вызовов модели сэкономлено).",
+                           stats["hits"], stats["misses"], stats["hit_rate"] * 100)
+        for label, label_stats in self.yolo_model.template_stats().items():
+            if label_stats["matches"] or label_stats["fallbacks"]:
+                self.plogging.info("[RainController] Шаблоны %s: быстрых ответов %d, переходов к YOLO %d, точность %s, "
+                                   "шаблон %s мс / YOLO %s мс.", label, label_stats["matches"], label_stats["fallbacks"],
+                                   label_stats["accuracy"], label_stats["match_ms_p50"], label_stats["yolo_ms_p50"])
         self.plogging.info("[RainController] Процесс humanized_collect_rain завершен.")
     
+    async def _click(self, account: AccountWindow, x_coord: int, y_coord: int, speed: Speed,
+                     jitter_range: tuple[int, int], focus: bool = False):
+        """
+        Хуманизированный клик под _input_lock: мышь и клавиатура заняты только одним аккаунтом.
+        Движение мыши выполняется в отдельном потоке, чтобы фоновые детекции не останавливались.
+        """
+        import pyautogui
+        async with self._input_lock:
+            if focus:
+                self.current_account = account
+                await account.window.focus_window()
+            await asyncio.to_thread(human_moveTo, x_coord, y_coord, speed=speed, jitter_range=jitter_range, debug=False)
+            await asyncio.sleep(0.15)
+            pyautogui.click()
+
+    def _windows_tiled(self, accounts: list[AccountWindow]) -> bool:
+        """Все окна видимы и не перекрываются - детекция в окне не требует его фокуса."""
+        regions = [account.window.get_region() for account in accounts]
+        return len(regions) >= 2 and all(region is not None for region in regions) and not _regions_overlap(regions)
+
+    def _account_stream(self, account: AccountWindow) -> DetectionStream:
+        """Отдельный поток детекций окна аккаунта для конвейерного сбора."""
+        stream = DetectionStream(self.yolo_model, self.plogging, rate=self.detections.rate)
+        stream.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+        return stream
+
+    async def _scan_account(self, account: AccountWindow) -> Detections | None:
+        """
+        Ищет join_rain / rain_joined в окне аккаунта без фокуса: свежая спекулятивная детекция,
+        запомненное место, затем все окно (до 5 сек).
+        """
+        detections = self._take_speculative(account)
+        if detections is not None:
+            return detections
+        detections = await self._check_cached_layout(account)
+        if detections is not None:
+            return detections
+        stream = self._account_stream(account)
+        try:
+            detections = await stream.wait_for(any_of=RAIN_LABELS, timeout=5)
+        finally:
+            stream.stop()
+        self._remember_layout(account, detections)
+        return detections
+
+    async def _confirm_join(self, account: AccountWindow):
+        """Фоновое подтверждение после клика: Cloudflare и rain_joined. Неподтвержденные аккаунты повторяет валидация."""
+        stream = self._account_stream(account)
+        try:
+            await asyncio.sleep(1)
+            await self._wait_cloudflare(account, stream)
+            joined = await self._check_rain_joined(account, stream)
+        finally:
+            stream.stop()
+        if joined:
+            account.rain_connected = True
+            self.plogging.info(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} успешно собрал рейн.")
+        else:
+            self.plogging.warn(f"[RainController:{account.extension.profile_name}] Рейн не подтвержден для {account.extension.profile_name}, повтор при валидации.")
+
+    async def _collect_pipelined(self, accounts: list[AccountWindow]):
+        """
+        Конвейерный сбор: окно следующего аккаунта сканируется, пока текущий аккаунт кликает,
+        а подтверждения уже кликнувших аккаунтов идут в фоне. Клики выполняются по одному (_click).
+        """
+        self.plogging.info(f"[RainController] Конвейерный сбор для {len(accounts)} аккаунтов.")
+        confirmations = []
+        next_scan = asyncio.create_task(self._scan_account(accounts[0]))
+        for index, account in enumerate(accounts):
+            detections = await next_scan
+            if index + 1 < len(accounts):
+                next_scan = asyncio.create_task(self._scan_account(accounts[index + 1]))
+
+            if detections is not None and self._extract_coords_from_detections(detections, "rain_joined"):
+                self.plogging.info(f"[RainController:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} уже присоединился к рейну.")
+                account.rain_connected = True
+                continue
+            target_coords = self._extract_coords_from_detections(detections, "join_rain") if detections else None
+            if not target_coords:
+                self.plogging.warn(f"[RainController:{account.extension.profile_name}] join_rain не найден для {account.extension.profile_name}, повтор при валидации.")
+                continue
+
+            x_coord, y_coord = target_coords
+            self.plogging.info(f"[RainController:{account.extension.profile_name}] Humanized click по ({x_coord}, {y_coord}) для {account.extension.profile_name}.")
+            try:
+                await self._click(account, x_coord, y_coord, Speed.MEDIUM, (3, 3), focus=True)
+            except Exception as e:
+                self.plogging.error(f"[RainController:{account.extension.profile_name}] Ошибка при клике для {account.extension.profile_name}: {e}")
+                continue
+            confirmations.append(asyncio.create_task(self._confirm_join(account)))
+
+        await asyncio.gather(*confirmations, return_exceptions=True)
+
     async def _humanized_rain_collect(self, account: AccountWindow, target_coords: tuple[int, int]) -> bool:
         """
         Выполняет сбор рейна с хуманизированным движением мыши
@@ -272,18 +586,18 @@ class RainController:
         Returns:
             True если рейн успешно собран, False иначе
         """
-        self.plogging.info(f"[_humanized_rain_collect] Начало сбора рейна для {account.extension.profile_name}.")
+        self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Начало сбора рейна для {account.extension.profile_name}.")
         
         # Проверяем, не присоединен ли уже аккаунт
         joined = await self._check_rain_joined(account)
         if joined:
-            self.plogging.info(f"[_humanized_rain_collect] Аккаунт {account.extension.profile_name} уже присоединен.")
+            self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} уже присоединен.")
             account.rain_connected = True
             return True
         
         # Выполняем хуманизированный клик по кнопке join_rain
         x_coord, y_coord = target_coords
-        self.plogging.info(f"[_humanized_rain_collect] Выполняем humanized click по ({x_coord}, {y_coord}) для {account.extension.profile_name}.")
+        self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Выполняем humanized click по ({x_coord}, {y_coord}) для {account.extension.profile_name}.")
         
         try:
             # Используем хуманизированное движение с случайным jitter и средней скоростью
@@ -299,7 +613,7 @@ class RainController:
             pyautogui.click()
             
         except Exception as e:
-            self.plogging.error(f"[_humanized_rain_collect] Ошибка при клике: {e}")
+            self.plogging.error(f"[_humanized_rain_collect:{account.extension.profile_name}] Ошибка при клике: {e}")
             return False
         
         await asyncio.sleep(1)
@@ -312,34 +626,29 @@ class RainController:
         joined = await self._check_rain_joined(account)
         
         if not joined:
-            self.plogging.warn(f"[_humanized_rain_collect] Рейн не подтвержден для {account.extension.profile_name} после первого клика. Пробуем еще раз.")
+            self.plogging.warn(f"[_humanized_rain_collect:{account.extension.profile_name}] Рейн не подтвержден для {account.extension.profile_name} после первого клика. Пробуем еще раз.")
             
             # Обновляем страницу
             await account.window.refresh_page()
-            await asyncio.sleep(3)
             
             # Ищем join_rain снова
             new_coords = None
-            for i in range(3):
-                detections = await self.yolo_model.detect_objects()
-                new_coords = self._extract_coords_from_detections(detections, "join_rain")
-                rain_joined = self._extract_coords_from_detections(detections, "rain_joined")
-                if new_coords:
-                    self.plogging.info(f"[_humanized_rain_collect] Найден join_rain после обновления (попытка {i+1}/3).")
-                    break
-                if rain_joined:
-                    self.plogging.info(f"[_humanized_rain_collect] Аккаунт {account.extension.profile_name} присоединился к рейну после обновления (rain_joined найден).")
+            detections = await self.detections.wait_for(any_of=RAIN_LABELS, timeout=3)
+            if detections is not None:
+                if self._extract_coords_from_detections(detections, "rain_joined"):
+                    self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} присоединился к рейну после обновления (rain_joined найден).")
                     account.rain_connected = True
                     return True
-                await asyncio.sleep(0.7)
+                new_coords = self._extract_coords_from_detections(detections, "join_rain")
+                self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Найден join_rain после обновления.")
             
             if not new_coords:
-                self.plogging.error(f"[_humanized_rain_collect] join_rain не найден после обновления для {account.extension.profile_name}.")
+                self.plogging.error(f"[_humanized_rain_collect:{account.extension.profile_name}] join_rain не найден после обновления для {account.extension.profile_name}.")
                 return False
             
             # Повторный хуманизированный клик
             x_coord, y_coord = new_coords
-            self.plogging.info(f"[_humanized_rain_collect] Повторный humanized click по ({x_coord}, {y_coord}).")
+            self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Повторный humanized click по ({x_coord}, {y_coord}).")
             
             try:
                 human_moveTo(
@@ -352,7 +661,7 @@ class RainController:
                 import pyautogui
                 pyautogui.click()
             except Exception as e:
-                self.plogging.error(f"[_humanized_rain_collect] Ошибка при повторном клике: {e}")
+                self.plogging.error(f"[_humanized_rain_collect:{account.extension.profile_name}] Ошибка при повторном клике: {e}")
                 return False
             
             await asyncio.sleep(1)
@@ -362,91 +671,78 @@ class RainController:
             # Финальная проверка
             joined = await self._check_rain_joined(account)
             if not joined:
-                self.plogging.error(f"[_humanized_rain_collect] Не удалось собрать рейн для {account.extension.profile_name} даже после повторной попытки.")
+                self.plogging.error(f"[_humanized_rain_collect:{account.extension.profile_name}] Не удалось собрать рейн для {account.extension.profile_name} даже после повторной попытки.")
                 return False
         
-        self.plogging.info(f"[_humanized_rain_collect] Рейн успешно собран для {account.extension.profile_name}.")
+        self.plogging.info(f"[_humanized_rain_collect:{account.extension.profile_name}] Рейн успешно собран для {account.extension.profile_name}.")
         account.rain_connected = True
         return True
     
-    async def _check_rain_joined(self, account: AccountWindow) -> bool:
+    async def _check_rain_joined(self, account: AccountWindow, stream: DetectionStream | None = None) -> bool:
         """
         Проверяет, присоединился ли аккаунт к рейну
         
+        Args:
+            stream: поток детекций окна аккаунта (по умолчанию - общий self.detections)
+        
         Returns:
             True если найден rain_joined, False если найден join_rain или ничего не найдено
         """
-        async def _check_loop():
-            while True:
-                # Оптимизация: один вызов detect_objects вместо двух find_target
-                detections = await self.yolo_model.detect_objects()
-                
-                # Извлекаем координаты из детекций
-                rain_joined = self._extract_coords_from_detections(detections, "rain_joined")
-                join_rain = self._extract_coords_from_detections(detections, "join_rain")
-                
-                if rain_joined:
-                    self.plogging.info(f"[_check_rain_joined] Аккаунт {account.extension.profile_name} успешно присоединился (rain_joined найден).")
-                    return True
-                elif join_rain:
-                    self.plogging.info(f"[_check_rain_joined] Аккаунт {account.extension.profile_name} еще не присоединился (join_rain найден).")
-                    return False
-                else:
-                    self.plogging.info(f"[_check_rain_joined] Нет ни join_rain, ни rain_joined для {account.extension.profile_name}. Ожидание 1 сек.")
-                    await asyncio.sleep(1)
-        
-        try:
-            result = await asyncio.wait_for(_check_loop(), timeout=5)
-            return result
-        except asyncio.TimeoutError:
-            self.plogging.error(f"[_check_rain_joined] Таймаут проверки для {account.extension.profile_name}.")
+        stream = stream or self.detections
+        stream.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+        detections = await stream.wait_for(any_of=RAIN_LABELS, timeout=5)
+        if detections is None:
+            self.plogging.error(f"[_check_rain_joined:{account.extension.profile_name}] Таймаут проверки для {account.extension.profile_name}.")
             return False
+        if self._extract_coords_from_detections(detections, "rain_joined"):
+            self.plogging.info(f"[_check_rain_joined:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} успешно присоединился (rain_joined найден).")
+            return True
+        self.plogging.info(f"[_check_rain_joined:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} еще не присоединился (join_rain найден).")
+        return False
     
-    async def _wait_cloudflare(self, account: AccountWindow):
+    async def _wait_cloudflare(self, account: AccountWindow, stream: DetectionStream | None = None):
         """
-        Ожидает прохождения Cloudflare проверки и кликает по кнопке подтверждения если нужно
+        Ожидает прохождения Cloudflare проверки и кликает по кнопке подтверждения если нужно.
+        С отдельным потоком детекций (конвейерный сбор) перед кликом окно аккаунта снова получает фокус.
         """
+        refocus = stream is not None
+        stream = stream or self.detections
+
         async def _wait_loop():
             await asyncio.sleep(1)
+            stream.watch(account.window, CLOUDFLARE_LABELS, profile=account.extension.profile_name)
             while True:
-                # Оптимизация: один вызов detect_objects вместо двух find_target
-                detections = await self.yolo_model.detect_objects()
+                # Каждый следующий кадр потока: пока Cloudflare загружается, просто ждем новый кадр
+                detections = await stream.next()
                 
                 # Извлекаем координаты из детекций
                 cloudflare_loading = self._extract_coords_from_detections(detections, "cloudflare_loading")
                 confirm_cloudflare = self._extract_coords_from_detections(detections, "confirm_cloudflare")
                 
                 if cloudflare_loading:
-                    self.plogging.info(f"[_wait_cloudflare] Cloudflare загружается для {account.extension.profile_name}. Ожидание 0.7 сек.")
-                    await asyncio.sleep(0.7)
+                    self.plogging.info(f"[_wait_cloudflare:{account.extension.profile_name}] Cloudflare загружается для {account.extension.profile_name}.")
                     continue
                 elif confirm_cloudflare:
                     x_coord, y_coord = confirm_cloudflare
-                    self.plogging.info(f"[_wait_cloudflare] Найдена кнопка Cloudflare. Хуманизированный клик по ({x_coord}, {y_coord}).")
+                    self.plogging.info(f"[_wait_cloudflare:{account.extension.profile_name}] Найдена кнопка Cloudflare. Хуманизированный клик по ({x_coord}, {y_coord}).")
                     
                     # Хуманизированный клик по кнопке Cloudflare
-                    human_moveTo(
-                        x_coord, y_coord,
-                        speed=Speed.MEDIUM,
-                        jitter_range=(5, 5),
-                        debug=False
-                    )
-                    await asyncio.sleep(0.15)
-                    import pyautogui
-                    pyautogui.click()
+                    await self._click(account, x_coord, y_coord, Speed.MEDIUM, (5, 5), focus=refocus)
                     await asyncio.sleep(1)
                     break
                 else:
-                    self.plogging.info(f"[_wait_cloudflare] Cloudflare завершен или не обнаружен для {account.extension.profile_name}.")
+                    self.plogging.info(f"[_wait_cloudflare:{account.extension.profile_name}] Cloudflare завершен или не обнаружен для {account.extension.profile_name}.")
                     break
         
         try:
             await asyncio.wait_for(_wait_loop(), timeout=10)
-            self.plogging.info(f"[_wait_cloudflare] Завершение для {account.extension.profile_name}.")
+            self.plogging.info(f"[_wait_cloudflare:{account.extension.profile_name}] Завершение для {account.extension.profile_name}.")
             return True
         except asyncio.TimeoutError:
-            self.plogging.error(f"[_wait_cloudflare] Таймаут для {account.extension.profile_name}.")
+            self.plogging.error(f"[_wait_cloudflare:{account.extension.profile_name}] Таймаут для {account.extension.profile_name}.")
             return False
+        finally:
+            stream.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
     
     async def _validate_rain_collection(self):
         """
@@ -454,50 +750,52 @@ class RainController:
         """
         self.plogging.info("[_validate_rain_collection] Начало валидации сбора рейна.")
         
-        for account in self.paired_accounts:
+        # Если окна разложены без перекрытий, проверяем rain_joined во всех окнах одним батчем
+        prescan = await self._detect_accounts_batch(self.paired_accounts)
+        
+        for index, account in enumerate(self.paired_accounts):
             self.current_account = account
-            await account.window.focus_window()
-            await asyncio.sleep(2)
+            if prescan:
+                detections = prescan[index]
+            else:
+                await account.window.focus_window()
+                self.detections.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+                detections = await self.detections.wait_for(any_of=("rain_joined",), timeout=2)
             
             # Проверяем наличие rain_joined
-            detections = await self.yolo_model.detect_objects()
-            rain_joined = self._extract_coords_from_detections(detections, "rain_joined")
+            rain_joined = self._extract_coords_from_detections(detections, "rain_joined") if detections else None
             
             if rain_joined:
-                self.plogging.info(f"[_validate_rain_collection] Аккаунт {account.extension.profile_name} прошел валидацию (rain_joined найден).")
+                self.plogging.info(f"[_validate_rain_collection:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} прошел валидацию (rain_joined найден).")
                 account.rain_connected = True
                 continue
             
             # Если не найден - обновляем страницу и проверяем снова
-            self.plogging.warn(f"[_validate_rain_collection] Аккаунт {account.extension.profile_name} не прошел валидацию. Обновляем страницу.")
+            self.plogging.warn(f"[_validate_rain_collection:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} не прошел валидацию. Обновляем страницу.")
+            if prescan:
+                # При батчевой проверке окно еще не в фокусе, а F5 уходит активному окну
+                await account.window.focus_window()
             await account.window.refresh_page()
-            await asyncio.sleep(3)
-            
+
             # Ищем join_rain или rain_joined
-            for i in range(5):
-                # Оптимизация: один вызов detect_objects вместо двух find_target
-                detections = await self.yolo_model.detect_objects()
-                
-                # Извлекаем координаты из детекций
+            self.detections.watch(account.window, RAIN_LABELS, profile=account.extension.profile_name)
+            detections = await self.detections.wait_for(any_of=RAIN_LABELS, timeout=5)
+            join_rain = rain_joined = None
+            if detections is not None:
                 join_rain = self._extract_coords_from_detections(detections, "join_rain")
                 rain_joined = self._extract_coords_from_detections(detections, "rain_joined")
-                
-                if join_rain or rain_joined:
-                    self.plogging.info(f"[_validate_rain_collection] Найдено событие для {account.extension.profile_name}: {'rain_joined' if rain_joined else 'join_rain'} (попытка {i+1}/5).")
-                    break
-                    
-                await asyncio.sleep(1)
+                self.plogging.info(f"[_validate_rain_collection:{account.extension.profile_name}] Найдено событие для {account.extension.profile_name}: {'rain_joined' if rain_joined else 'join_rain'}.")
             
             if rain_joined:
-                self.plogging.info(f"[_validate_rain_collection] Аккаунт {account.extension.profile_name} успешно получил рейн после обновления.")
+                self.plogging.info(f"[_validate_rain_collection:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} успешно получил рейн после обновления.")
                 account.rain_connected = True
                 continue
             elif join_rain:
-                self.plogging.warn(f"[_validate_rain_collection] Аккаунт {account.extension.profile_name} не получил рейн. Повторная попытка сбора.")
+                self.plogging.warn(f"[_validate_rain_collection:{account.extension.profile_name}] Аккаунт {account.extension.profile_name} не получил рейн. Повторная попытка сбора.")
                 account.rain_connected = False
                 await self._humanized_rain_collect(account, join_rain)
             else:
-                self.plogging.error(f"[_validate_rain_collection] Не найдены объекты для {account.extension.profile_name} даже после обновления.")
+                self.plogging.error(f"[_validate_rain_collection:{account.extension.profile_name}] Не найдены объекты для {account.extension.profile_name} даже после обновления.")
         
         # Итоговая статистика
         collected = sum(1 for acc in self.paired_accounts if acc.rain_connected)
@@ -510,12 +808,15 @@ class RainController:
         """
         self.plogging.info(f"[RainController] Получен сигнал rain_end. Scrap: {scrap_count}, Users: {user_count}")
         self.rain_now = False
+        self.detections.stop()
+        self._stop_speculation()
+        self._speculative.clear()
         self.current_rain_scrap = -1
         self.current_user_count = -1
         await self.behavior_controller.start()
         # Сбрасываем флаги rain_connected для всех аккаунтов
         for account in self.paired_accounts:
             account.rain_connected = False
-            self.plogging.info(f"[RainController] Сброшено состояние для {account.extension.profile_name}.")
+            self.plogging.info(f"[RainController:{account.extension.profile_name}] Сброшено состояние для {account.extension.profile_name}.")
         
         self.plogging.info("[RainController] Готов к следующему рейну.")
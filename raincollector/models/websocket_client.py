@@ -29,9 +29,9 @@ class Websocket_client:
             else:
                 message = str(data)
             
-            self.logger.debug(f"[Client {self.profile_name or self.client_id}] 📤 Отправка: {data}")
+            self.logger.debug("[Client %s] 📤 Отправка: %s", self.profile_name or self.client_id, data)
             await self.websocket.send(message)
-            self.logger.debug(f"[Client {self.profile_name or self.client_id}] ✅ Отправлено успешно")
+            self.logger.debug("[Client %s] ✅ Отправлено успешно", self.profile_name or self.client_id)
         except Exception as e:
             self.logger.error(f"[Client {self.profile_name or self.client_id}] ❌ Ошибка отправки: {e}")
             # Убрали traceback чтобы не засорять логи при закрытом соединении
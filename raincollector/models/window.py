@@ -41,6 +41,23 @@ class pygetWindow:
         await asyncio.sleep(0.2)
         return False
     
+    def get_region(self) -> tuple[int, int, int, int] | None:
+        """
+        Возвращает область окна на экране (left, top, width, height), обрезанную по границам экрана.
+        Развернутые окна Windows выходят за экран на несколько пикселей, поэтому без обрезки
+        захват области завершился бы ошибкой. Возвращает None, если окно свернуто или вне экрана.
+        """
+        if not self.window or self.window.isMinimized:
+            return None
+        screen_w, screen_h = pyautogui.size()
+        left = max(0, self.window.left)
+        top = max(0, self.window.top)
+        right = min(screen_w, self.window.left + self.window.width)
+        bottom = min(screen_h, self.window.top + self.window.height)
+        if right <= left or bottom <= top:
+            return None
+        return (left, top, right - left, bottom - top)
+
     async def refresh_page(self):
         pyautogui.press('f5')
         await asyncio.sleep(3)
@@ -0,0 +1,187 @@
+"""
+Источники кадров для DetectionModel.
+
+Каждый источник возвращает кадр BGR (порядок каналов, который ожидает ultralytics для NumPy)
+в виде NumPy-представления переиспользуемого буфера: между кадрами память не выделяется
+и лишних копий не делается. Кадр действителен до следующего вызова grab() того же источника.
+
+- MssCapture       - быстрый захват экрана через mss (pip install mss)
+- PyAutoGuiCapture - запасной вариант через pyautogui.screenshot()
+- ReplayCapture    - воспроизведение записанных кадров из памяти, папки изображений или .npy файла;
+                     позволяет запускать и измерять детекцию без экрана (например, на Linux)
+"""
+import os
+import threading
+import numpy as np
+import cv2
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+class FrameBuffer:
+    """Переиспользуемый буфер кадров: выдает непрерывные представления нужной формы без выделения памяти."""
+
+    def __init__(self):
+        self._storage = np.empty(0, dtype=np.uint8)
+
+    def view(self, height: int, width: int, channels: int = 3) -> np.ndarray:
+        size = height * width * channels
+        if self._storage.size < size:
+            self._storage = np.empty(size, dtype=np.uint8)
+        return self._storage[:size].reshape(height, width, channels)
+
+
+class CaptureBackend:
+    """Базовый класс источника кадров."""
+
+    name = "base"
+
+    def grab(self, region: tuple[int, int, int, int] | None = None) -> np.ndarray:
+        """
+        Возвращает кадр BGR (height, width, 3) для области (left, top, width, height)
+        или всего экрана. Массив принадлежит источнику и перезаписывается следующим вызовом.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MssCapture(CaptureBackend):
+    """Захват экрана через mss: сырые BGRA-байты без PIL, одно преобразование в BGR в буфер."""
+
+    name = "mss"
+
+    def __init__(self):
+        import mss  # опциональная зависимость, проверяется в create_capture_backend()
+        self._mss = mss
+        # Экземпляр mss привязан к потоку (контексты GDI на Windows), поэтому храним свой для каждого потока
+        self._local = threading.local()
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._mss.mss()
+            self._local.sct = sct
+            self._local.buffer = FrameBuffer()
+        return sct
+
+    def grab(self, region=None) -> np.ndarray:
+        sct = self._sct()
+        if region:
+            left, top, width, height = region
+            monitor = {"left": left, "top": top, "width": width, "height": height}
+        else:
+            monitor = sct.monitors[1]  # основной монитор, как pyautogui.screenshot()
+        shot = sct.grab(monitor)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        frame = self._local.buffer.view(shot.height, shot.width)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=frame)
+        return frame
+
+    def close(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class PyAutoGuiCapture(CaptureBackend):
+    """Захват через pyautogui.screenshot(); RGB из PIL преобразуется в BGR сразу в буфер."""
+
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+        self._buffer = FrameBuffer()
+
+    def grab(self, region=None) -> np.ndarray:
+        image = self._pyautogui.screenshot(region=region) if region else self._pyautogui.screenshot()
+        rgb = np.asarray(image)
+        frame = self._buffer.view(rgb.shape[0], rgb.shape[1])
+        cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=frame)
+        return frame
+
+
+class ReplayExhausted(RuntimeError):
+    """Кадры ReplayCapture закончились (loop=False)."""
+
+
+class ReplayCapture(CaptureBackend):
+    """
+    Воспроизводит записанные кадры вместо захвата экрана.
+
+    Args:
+        source: список массивов BGR, папка с изображениями или .npy файл формы (N, H, W, 3)
+                (открывается через mmap, кадры читаются с диска по мере обращения)
+        loop: начинать сначала после последнего кадра
+        advance: переходить к следующему кадру при каждом grab(); иначе - только через next_frame()
+    """
+
+    name = "replay"
+
+    def __init__(self, source, loop: bool = True, advance: bool = True):
+        if isinstance(source, (list, tuple)):
+            self._frames = list(source)
+            self.paths = [None] * len(self._frames)
+        elif isinstance(source, str) and source.endswith(".npy"):
+            self._frames = np.load(source, mmap_mode="r")
+            self.paths = [None] * len(self._frames)
+        elif isinstance(source, str) and os.path.isdir(source):
+            self.paths = sorted(
+                os.path.join(source, file) for file in os.listdir(source)
+                if file.lower().endswith(IMAGE_EXTENSIONS)
+            )
+            self._frames = [cv2.imread(path, cv2.IMREAD_COLOR) for path in self.paths]
+        else:
+            raise ValueError(f"Unsupported replay source: {source!r}")
+        if len(self._frames) == 0:
+            raise ValueError(f"Replay source {source!r} contains no frames")
+        self.loop = loop
+        self.advance = advance
+        self.index = -1 if advance else 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def current_path(self) -> str | None:
+        return self.paths[self.index] if self.index >= 0 else None
+
+    def next_frame(self) -> bool:
+        """Переходит к следующему кадру. Возвращает False, если кадры закончились (при loop=False)."""
+        if self.index + 1 >= len(self._frames):
+            if not self.loop:
+                return False
+            self.index = -1
+        self.index += 1
+        return True
+
+    def grab(self, region=None) -> np.ndarray:
+        if self.advance and not self.next_frame():
+            # Не StopIteration: asyncio не может передать его через Future, и ожидающий detect_objects зависает
+            raise ReplayExhausted("replay source exhausted")
+        frame = self._frames[max(self.index, 0)]
+        if region:
+            left, top, width, height = region
+            return frame[top:top + height, left:left + width]  # представление, без копирования
+        return frame
+
+
+def create_capture_backend(name: str = "auto", **kwargs) -> CaptureBackend:
+    """
+    Создает источник кадров по имени: 'auto' (mss, если установлен, иначе pyautogui),
+    'mss', 'pyautogui' или 'replay' (аргументы передаются в ReplayCapture).
+    """
+    if name == "replay":
+        return ReplayCapture(**kwargs)
+    if name in ("auto", "mss"):
+        try:
+            return MssCapture()
+        except ImportError:
+            if name == "mss":
+                raise
+    if name in ("auto", "pyautogui"):
+        return PyAutoGuiCapture()
+    raise ValueError(f"Unknown capture backend: {name}")
@@ -0,0 +1,118 @@
+"""
+Непрерывный поток детекций для активного окна.
+
+DetectionStream с заданной частотой запускает detect_objects для отслеживаемого окна и публикует
+последний результат. Вместо циклов «проверить - поспать - проверить» вызывающий код ждет нужное
+состояние экрана:
+
+    detections = await stream.wait_for(any_of={"join_rain", "rain_joined"}, timeout=5)
+
+и продолжает работу на первом же подходящем кадре. Время реакции ограничено задержкой инференса,
+а частота выборки - общим числом вызовов модели.
+"""
+import asyncio
+import time
+from raincollector.utils.plogging import Plogging
+from raincollector.utils.detections import Detections
+
+
+class DetectionStream:
+    """
+    Фоновая выборка детекций одного окна.
+
+    Args:
+        model: DetectionModel
+        logger: Plogging
+        rate: сколько кадров в секунду запрашивать (верхняя граница; при медленном инференсе - меньше)
+        labels: метки, которые ищет модель (None - все классы); можно сменить в watch()
+    """
+
+    def __init__(self, model, logger: Plogging, rate: float = 5.0, labels=None):
+        self.model = model
+        self.plogging = logger
+        self.rate = rate
+        self.labels = tuple(labels) if labels is not None else None
+        self.region = None          # окно pygetWindow или кортеж (left, top, width, height)
+        self.profile: str | None = None  # профиль аккаунта окна (для записи кадров)
+        self.latest: Detections | None = None
+        self.latest_time = 0.0      # time.monotonic() начала захвата последнего кадра
+        self.frames = 0
+        self._generation = 0        # меняется при смене окна или меток; кадры прошлых поколений не публикуются
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def watch(self, region, labels=..., profile: str | None = None):
+        """
+        Начинает (или переключает) выборку для окна region. labels меняет набор меток;
+        по умолчанию остается прежний. Результаты для прежнего окна и меток сбрасываются.
+        """
+        self.region = region
+        self.profile = profile
+        if labels is not ...:
+            self.labels = tuple(labels) if labels is not None else None
+        self._generation += 1
+        self.latest = None
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Останавливает выборку после текущего кадра."""
+        self.region = None
+        self._generation += 1
+        self.latest = None
+
+    async def _run(self):
+        period = 1.0 / self.rate if self.rate > 0 else 0.0
+        while self.region is not None:
+            generation = self._generation
+            started = time.monotonic()
+            detections = await self.model.detect_objects(region=self.region, labels=self.labels, profile=self.profile)
+            if generation == self._generation:
+                async with self._changed:
+                    self.latest = detections
+                    self.latest_time = started
+                    self.frames += 1
+                    self._changed.notify_all()
+            await asyncio.sleep(max(0.0, period - (time.monotonic() - started)))
+
+    async def wait_for(self, any_of=None, all_of=None, predicate=None, timeout: float | None = None,
+                       fresh: bool = True) -> Detections | None:
+        """
+        Ждет кадр, удовлетворяющий условию, и возвращает его детекции; по таймауту возвращает None.
+
+        Args:
+            any_of: хотя бы одна из меток должна быть найдена
+            all_of: все метки должны быть найдены
+            predicate: дополнительное условие predicate(detections) -> bool
+            timeout: максимальное время ожидания в секундах (None - без ограничения)
+            fresh: учитывать только кадры, захват которых начался после вызова; иначе подходит и последний кадр
+        """
+        since = time.monotonic() if fresh else float("-inf")
+
+        def ready() -> bool:
+            detections = self.latest
+            if detections is None or self.latest_time < since:
+                return False
+            if any_of and not any(label in detections for label in any_of):
+                return False
+            if all_of and not all(label in detections for label in all_of):
+                return False
+            return predicate is None or predicate(detections)
+
+        async def _wait():
+            async with self._changed:
+                await self._changed.wait_for(ready)
+                return self.latest
+
+        try:
+            return await asyncio.wait_for(_wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def next(self, timeout: float | None = None) -> Detections | None:
+        """Детекции следующего кадра (захваченного после вызова) или None по таймауту."""
+        return await self.wait_for(timeout=timeout)
@@ -0,0 +1,152 @@
+"""
+Компактный результат детекции DetectionModel.
+
+Detections хранит все найденные объекты одного кадра в NumPy-массивах: id меток, рамки
+(x, y, width, height) в экранных координатах, уверенности и заранее вычисленные центры.
+Результат YOLO переводится в Detections одним проходом на уровне массивов, без цикла по рамкам.
+Прежний формат словаря { 'метка': (x, y, w, h) или [(x, y, w, h), ...] } доступен через as_dict().
+"""
+import numpy as np
+
+
+class Detections:
+    """
+    Детекции одного кадра. Объект неизменяемый, поэтому его можно хранить в кэше и отдавать без копирования.
+
+    Args:
+        names: соответствие id класса -> название метки (model.names)
+        label_ids: (N,) id классов
+        boxes: (N, 4) рамки (x, y, width, height)
+        confidences: (N,) уверенности
+    """
+
+    __slots__ = ("names", "label_ids", "boxes", "confidences", "centers", "_label_index")
+
+    def __init__(self, names: dict, label_ids: np.ndarray, boxes: np.ndarray, confidences: np.ndarray):
+        self.names = names
+        self.label_ids = label_ids
+        self.boxes = boxes
+        self.confidences = confidences
+        self.centers = boxes[:, :2] + boxes[:, 2:] // 2
+        self._label_index = {name: class_id for class_id, name in names.items()}
+        for array in (label_ids, boxes, confidences, self.centers):
+            array.setflags(write=False)
+
+    @classmethod
+    def empty(cls, names: dict) -> "Detections":
+        return cls(names, np.empty(0, dtype=np.int32), np.empty((0, 4), dtype=np.int32),
+                   np.empty(0, dtype=np.float32))
+
+    @classmethod
+    def from_boxes(cls, names: dict, items: list) -> "Detections":
+        """Собирает Detections из готовых рамок: [(метка, (x, y, width, height), уверенность), ...]."""
+        if not items:
+            return cls.empty(names)
+        label_index = {name: class_id for class_id, name in names.items()}
+        return cls(names,
+                   np.array([label_index[label] for label, _, _ in items], dtype=np.int32),
+                   np.array([box for _, box, _ in items], dtype=np.int32).reshape(-1, 4),
+                   np.array([confidence for _, _, confidence in items], dtype=np.float32))
+
+    @classmethod
+    def from_result(cls, result, names: dict, offset_x: int = 0, offset_y: int = 0,
+                    threshold: float = 0.7, thresholds: dict | None = None) -> "Detections":
+        """
+        Переводит результат YOLO для одного кадра в Detections.
+
+        Рамки забираются с устройства одной передачей (boxes.data: x1, y1, x2, y2, conf, cls),
+        фильтрация по порогам и перевод в экранные координаты выполняются над массивами целиком.
+
+        Args:
+            threshold: порог уверенности по умолчанию (объект проходит при conf > порога)
+            thresholds: пороги по названиям меток, например {'join_rain': 0.6}
+        """
+        data = result.boxes.data
+        if hasattr(data, "cpu"):
+            data = data.cpu().numpy()
+        return cls.from_array(data, names, offset_x, offset_y, threshold, thresholds)
+
+    @classmethod
+    def from_array(cls, data: np.ndarray, names: dict, offset_x: int = 0, offset_y: int = 0,
+                   threshold: float = 0.7, thresholds: dict | None = None) -> "Detections":
+        """То же, что from_result, для готового массива boxes.data (N x 6), например из процесса пула."""
+        if len(data) == 0:
+            return cls.empty(names)
+
+        label_ids = data[:, 5].astype(np.int32)
+        confidences = data[:, 4].astype(np.float32)
+        # Порог для каждого класса одной таблицей: индексация по label_ids вместо словаря на каждую рамку
+        limits = np.full(max(max(names, default=0), int(label_ids.max())) + 1, threshold, dtype=np.float32)
+        if thresholds:
+            label_index = {name: class_id for class_id, name in names.items()}
+            for label, value in thresholds.items():
+                if label in label_index:
+                    limits[label_index[label]] = value
+        keep = confidences > limits[label_ids]
+
+        xyxy = data[keep, :4]
+        boxes = np.empty((len(xyxy), 4), dtype=np.int32)
+        boxes[:, 0] = xyxy[:, 0].astype(np.int32) + offset_x
+        boxes[:, 1] = xyxy[:, 1].astype(np.int32) + offset_y
+        boxes[:, 2] = (xyxy[:, 2] - xyxy[:, 0]).astype(np.int32)
+        boxes[:, 3] = (xyxy[:, 3] - xyxy[:, 1]).astype(np.int32)
+        return cls(names, label_ids[keep], boxes, confidences[keep])
+
+    def __len__(self) -> int:
+        return len(self.label_ids)
+
+    def __bool__(self) -> bool:
+        return len(self.label_ids) > 0
+
+    def __contains__(self, label: str) -> bool:
+        return self.best_index(label) is not None
+
+    def __repr__(self) -> str:
+        return f"Detections({self.as_dict()!r})"
+
+    @property
+    def labels(self) -> list[str]:
+        """Названия найденных меток без повторов, в порядке первого появления."""
+        _, first = np.unique(self.label_ids, return_index=True)
+        return [self.names.get(int(self.label_ids[i]), str(int(self.label_ids[i]))) for i in sorted(first)]
+
+    def best_index(self, label: str) -> int | None:
+        """Индекс рамки метки с наибольшей уверенностью или None, если метка не найдена."""
+        class_id = self._label_index.get(label)
+        if class_id is None:
+            return None
+        mask = self.label_ids == class_id
+        if not mask.any():
+            return None
+        return int(np.flatnonzero(mask)[np.argmax(self.confidences[mask])])
+
+    def best_box(self, label: str) -> tuple[int, int, int, int] | None:
+        """Рамка (x, y, width, height) метки с наибольшей уверенностью."""
+        index = self.best_index(label)
+        return None if index is None else tuple(int(v) for v in self.boxes[index])
+
+    def center(self, label: str) -> tuple[int, int] | None:
+        """Центр (x, y) рамки метки с наибольшей уверенностью."""
+        index = self.best_index(label)
+        return None if index is None else (int(self.centers[index, 0]), int(self.centers[index, 1]))
+
+    def confidence(self, label: str) -> float | None:
+        index = self.best_index(label)
+        return None if index is None else float(self.confidences[index])
+
+    def as_dict(self) -> dict:
+        """
+        Словарь в прежнем формате detect_objects:
+        { 'метка': (x, y, width, height) } для одной рамки и { 'метка': [(x, y, width, height), ...] } для нескольких.
+        """
+        detection_dict = {}
+        for class_id, box in zip(self.label_ids.tolist(), self.boxes.tolist()):
+            label = self.names.get(class_id, str(class_id))
+            coords = tuple(box)
+            if label not in detection_dict:
+                detection_dict[label] = coords
+            elif isinstance(detection_dict[label], tuple):
+                detection_dict[label] = [detection_dict[label], coords]
+            else:
+                detection_dict[label].append(coords)
+        return detection_dict
@@ -0,0 +1,208 @@
+"""
+Асинхронная запись кадров с нарисованными детекциями для разбора неудачных рейнов.
+
+FrameRecorder включается явно (DetectionModel(..., recorder=FrameRecorder(...))). Поток инференса
+только копирует кадр в ограниченную очередь; рамки рисуются и кадр кодируется в JPEG/WebP в пуле
+рабочих потоков (cv2.imencode отпускает GIL). Если очередь заполнена, кадр отбрасывается -
+запись никогда не задерживает детекцию.
+
+Файлы пишутся в <root>/<рейн>/<профиль>/<время>_<номер>.jpg; при превышении max_bytes
+удаляются самые старые кадры. Ограничение размера учитывает и удаляет только файлы с таким
+именем и расширением, а из папок - только созданные рекордером: прочие файлы в root не трогаются.
+"""
+import datetime
+import os
+import queue
+import re
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from raincollector.utils.plogging import Plogging
+
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+# <время>_<номер>[_<тег>].<расширение> - имя, под которым _write сохраняет кадр
+_FRAME_NAME_RE = re.compile(r"^\d{2}-\d{2}-\d{2}_\d{6}_\d{6}(?:_[\w.-]+)?(?:%s)$"
+                            % "|".join(re.escape(extension) for extension, _ in FORMATS.values()))
+
+
+def _safe_name(value: str) -> str:
+    return "".join(char if char.isalnum() or char in "-_." else "_" for char in value) or "_"
+
+
+def _color(class_id: int) -> tuple[int, int, int]:
+    # Устойчивый цвет метки без таблицы: разброс оттенков по id класса
+    hue = np.uint8([[[(class_id * 47) % 180, 220, 255]]])
+    return tuple(int(v) for v in cv2.cvtColor(hue, cv2.COLOR_HSV2BGR)[0, 0])
+
+
+class FrameRecorder:
+    """
+    Args:
+        root: папка для кадров
+        max_bytes: предельный общий размер папки; старые кадры удаляются
+        queue_size: сколько кадров может ждать кодирования; остальные отбрасываются
+        workers: потоков кодирования
+        fmt: 'jpg' или 'webp'
+        quality: качество сжатия (0-100)
+        logger: Plogging для ошибок записи
+    """
+
+    def __init__(self, root: str = "debug_frames", max_bytes: int = 512 * 2**20, queue_size: int = 16,
+                 workers: int = 2, fmt: str = "jpg", quality: int = 85, logger: Plogging | None = None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported frame format: {fmt}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.extension, quality_flag = FORMATS[fmt]
+        self.encode_params = [quality_flag, int(quality)]
+        self.plogging = logger
+        self.rain_id = "idle"  # задается RainController на время рейна
+        self.recorded = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._files: deque = deque()  # (путь, размер) в порядке записи
+        self._total = 0
+        self._dirs: set = set()  # папки рейнов и профилей, которые можно удалить, когда они опустеют
+        self._scan_existing()
+        self._workers = [threading.Thread(target=self._work, name=f"frame-recorder-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _scan_existing(self):
+        """
+        Учитывает кадры прошлых запусков (только <root>/<рейн>/<профиль>/<кадр>),
+        чтобы ограничение размера действовало и на них.
+        """
+        found = []
+        for rain_dir in self._subdirs(self.root):
+            for profile_dir in self._subdirs(rain_dir):
+                try:
+                    names = os.listdir(profile_dir)
+                except OSError:
+                    continue
+                for name in names:
+                    if not _FRAME_NAME_RE.match(name):
+                        continue
+                    path = os.path.join(profile_dir, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+                    self._dirs.update((profile_dir, rain_dir))
+        for _, path, size in sorted(found):
+            self._files.append((path, size))
+            self._total += size
+
+    @staticmethod
+    def _subdirs(directory: str) -> list:
+        try:
+            return [entry.path for entry in os.scandir(directory) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return []
+
+    def start_rain(self, rain_id: str | None = None):
+        """Новая папка рейна для следующих кадров (по умолчанию - по времени начала)."""
+        self.rain_id = _safe_name(rain_id or datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+
+    def submit(self, frame: np.ndarray, detections, offset: tuple[int, int] = (0, 0),
+               profile: str | None = None, tag: str = ""):
+        """
+        Ставит кадр в очередь записи; вызывается из потока инференса и не блокируется.
+        Кадр копируется (буфер источника будет перезаписан), но только если в очереди есть место.
+        """
+        if self._queue.full():
+            self.dropped += 1
+            return
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        item = (frame.copy(), detections, offset, profile or "unknown", tag, self.rain_id, sequence,
+                datetime.datetime.now())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                if self.plogging:
+                    self.plogging.error(f"[FrameRecorder] Ошибка записи кадра: {e}")
+
+    def _annotate(self, frame: np.ndarray, detections, offset: tuple[int, int]) -> np.ndarray:
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        offset_x, offset_y = offset
+        for class_id, (x, y, width, height), confidence in zip(detections.label_ids.tolist(),
+                                                               detections.boxes.tolist(),
+                                                               detections.confidences.tolist()):
+            color = _color(class_id)
+            left, top = x - offset_x, y - offset_y
+            cv2.rectangle(frame, (left, top), (left + width, top + height), color, 2)
+            label = f"{detections.names.get(class_id, class_id)} {confidence:.2f}"
+            cv2.putText(frame, label, (left, max(12, top - 4)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+        return frame
+
+    def _write(self, frame, detections, offset, profile, tag, rain_id, sequence, captured_at):
+        ok, encoded = cv2.imencode(self.extension, self._annotate(frame, detections, offset), self.encode_params)
+        if not ok:
+            raise RuntimeError("encoding failed")
+        rain_dir = os.path.join(self.root, rain_id)
+        directory = os.path.join(rain_dir, _safe_name(profile))
+        created = [path for path in (rain_dir, directory) if not os.path.isdir(path)]
+        os.makedirs(directory, exist_ok=True)
+        name = f"{captured_at:%H-%M-%S_%f}_{sequence:06d}{'_' + _safe_name(tag) if tag else ''}{self.extension}"
+        path = os.path.join(directory, name)
+        encoded.tofile(path)
+        with self._lock:
+            self._dirs.update(created)
+            self._files.append((path, encoded.size))
+            self._total += encoded.size
+            self.recorded += 1
+            self._enforce_limit()
+
+    def _enforce_limit(self):
+        while self._total > self.max_bytes and len(self._files) > 1:
+            path, size = self._files.popleft()
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            profile_dir = os.path.dirname(path)
+            for directory in (profile_dir, os.path.dirname(profile_dir)):
+                if directory not in self._dirs:
+                    break
+                try:
+                    if os.listdir(directory):
+                        break
+                    os.rmdir(directory)
+                    self._dirs.discard(directory)
+                except OSError:
+                    break
+
+    def stats(self) -> dict:
+        return {"recorded": self.recorded, "dropped": self.dropped, "pending": self._queue.qsize(),
+                "bytes": self._total}
+
+    def close(self):
+        """Дописывает очередь и останавливает рабочие потоки."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
@@ -0,0 +1,56 @@
+"""
+Выполнение инференса YOLO вне цикла событий.
+
+InferenceExecutor держит выделенный рабочий поток, в котором выполняются захват кадра
+и вызов модели. Цикл событий только ожидает результат, поэтому WebSocket-пинги,
+прием сообщений rain_api и задачи BehaviorController не блокируются на время инференса.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceExecutor:
+    """
+    Выделенный поток инференса с ограниченным числом ожидающих вызовов.
+
+    Args:
+        max_pending: сколько вызовов одновременно могут находиться в очереди потока (включая выполняемый);
+                     остальные вызывающие ждут своей очереди в цикле событий
+        torch_threads: число потоков intra-op PyTorch (torch.set_num_threads); None - значение по умолчанию
+        name: префикс имени рабочего потока
+    """
+
+    def __init__(self, max_pending: int = 4, torch_threads: int | None = None, name: str = "yolo-inference"):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._slots = asyncio.Semaphore(max_pending)
+        self.max_pending = max_pending
+        self.torch_threads = torch_threads
+        self.waiting = 0  # вызовов, ожидающих свободного места в очереди
+        if torch_threads:
+            self._executor.submit(self._configure_torch, torch_threads)
+
+    @staticmethod
+    def _configure_torch(threads: int):
+        import torch
+        torch.set_num_threads(threads)
+
+    async def run(self, fn, *args, **kwargs):
+        """Выполняет fn(*args, **kwargs) в потоке инференса и возвращает результат."""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        """Ставит fn в поток инференса без ожидания (например, из кода до запуска цикла событий)."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
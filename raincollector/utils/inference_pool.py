@@ -0,0 +1,286 @@
+"""
+Пул процессов инференса с передачей кадров через разделяемую память.
+
+Один экземпляр YOLO в процессе ограничивает пропускную способность детекции одним вызовом модели
+за раз. InferencePool запускает несколько рабочих процессов, у каждого своя копия модели.
+Кадры не сериализуются: вызывающий копирует кадр в слот разделяемой памяти (SharedMemory),
+в очередь процесса уходит только имя слота, форма кадра и параметры predict, обратно - массив
+рамок boxes.data (N x 6). Планировщик отдает запрос процессу с наименьшим числом выполняемых запросов.
+
+Поток приема результатов следит и за процессами: если процесс завершился (нехватка памяти, сбой CUDA),
+ожидающие его запросы завершаются ошибкой, а процесс перезапускается (не более max_restarts раз,
+затем выводится из работы). Запрос, не получивший ответа за request_timeout, тоже завершается ошибкой,
+а зависший процесс останавливается и перезапускается.
+
+Пул используется через DetectionModel.start_pool(): захват кадра, кэш и шаблоны остаются
+в потоке инференса, а вызов модели выполняется в свободном процессе пула.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from raincollector.utils.plogging import Plogging
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Слоты создает и удаляет родительский процесс; рабочий процесс только подключается к ним
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(index: int, model_path: str, backend: str, torch_threads: int, requests, results):
+    """Цикл рабочего процесса: загружает модель и выполняет запросы (request_id, слот, форма, kwargs)."""
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+        from ultralytics import YOLO
+        from raincollector.utils.model_export import resolve_model_path
+        model = YOLO(resolve_model_path(model_path, backend), task="detect")
+        model.predict(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)  # прогрев
+    except Exception as e:
+        results.put(("ready", index, None, repr(e)))
+        return
+    results.put(("ready", index, None, None))
+
+    segments = {}
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, slot_name, shape, kwargs = message
+        try:
+            segment = segments.get(slot_name)
+            if segment is None:
+                segment = segments[slot_name] = _attach(slot_name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+            data = model.predict(frame, **kwargs)[0].boxes.data
+            del frame  # представление должно быть освобождено до закрытия сегмента
+            results.put((request_id, index, data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data), None))
+        except Exception as e:
+            results.put((request_id, index, None, repr(e)))
+    for segment in segments.values():
+        segment.close()
+
+
+class InferencePool:
+    """
+    Args:
+        model_path: исходная модель .pt (экспортированный бэкенд выбирается через resolve_model_path)
+        workers: число рабочих процессов
+        backend: бэкенд инференса, как у DetectionModel
+        torch_threads: потоков PyTorch в каждом процессе (1 - процессы не конкурируют за ядра)
+        slots: число слотов разделяемой памяти (ограничивает число одновременных запросов); по умолчанию 2 на процесс
+        slot_bytes: размер слота - наибольший кадр, который можно передать (по умолчанию 2560x1440 BGR)
+        request_timeout: сколько секунд ждать ответа процесса, прежде чем считать его зависшим
+        max_restarts: сколько раз перезапускать упавший процесс, прежде чем вывести его из работы
+        logger: Plogging
+    """
+
+    def __init__(self, model_path: str, workers: int, backend: str = "pt", torch_threads: int = 1,
+                 slots: int | None = None, slot_bytes: int = 2560 * 1440 * 3, request_timeout: float = 30.0,
+                 max_restarts: int = 3, logger: Plogging | None = None):
+        self.model_path = model_path
+        self.workers = workers
+        self.backend = backend
+        self.torch_threads = torch_threads
+        self.slot_bytes = slot_bytes
+        self.request_timeout = request_timeout
+        self.max_restarts = max_restarts
+        self.plogging = logger
+        self._slot_count = slots or workers * 2
+        self._context = None
+        self._segments: list[shared_memory.SharedMemory] = []
+        self._free_slots: asyncio.Queue | None = None
+        self._processes = []
+        self._requests = []
+        self._results = None
+        self._collector: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: dict = {}  # request_id -> (future, индекс процесса)
+        self._ready: asyncio.Future | None = None
+        self._ready_count = 0
+        self._closing = False
+        self._ids = itertools.count()
+        self.in_flight = [0] * workers
+        self.completed = [0] * workers
+        self.restarts = [0] * workers
+        self.retired: set[int] = set()
+
+    async def start(self):
+        """Создает слоты, запускает процессы и ждет, пока каждый загрузит модель."""
+        self._loop = asyncio.get_running_loop()
+        self._ready = self._loop.create_future()
+        self._context = multiprocessing.get_context("spawn")  # одинаково на Windows и Linux, без копии состояния родителя
+        self._results = self._context.Queue()
+        self._segments = [shared_memory.SharedMemory(create=True, size=self.slot_bytes) for _ in range(self._slot_count)]
+        self._free_slots = asyncio.Queue()
+        for slot in range(self._slot_count):
+            self._free_slots.put_nowait(slot)
+        self._requests = [None] * self.workers
+        self._processes = [None] * self.workers
+        for index in range(self.workers):
+            self._spawn(index)
+        self._collector = threading.Thread(target=self._collect, name="yolo-pool-results", daemon=True)
+        self._collector.start()
+        await self._ready
+
+    def _spawn(self, index: int):
+        requests = self._context.Queue()
+        process = self._context.Process(target=_worker_main, name=f"yolo-pool-{index}", daemon=True,
+                                        args=(index, self.model_path, self.backend, self.torch_threads,
+                                              requests, self._results))
+        process.start()
+        self._requests[index] = requests
+        self._processes[index] = process
+
+    def _collect(self):
+        """
+        Поток приема результатов: передает их ожидающим future в цикл событий
+        и сообщает о завершившихся процессах.
+        """
+        reported = set()
+        while True:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                message = ...
+            if message is None:
+                return
+            if message is not ...:
+                self._loop.call_soon_threadsafe(self._deliver, message)
+            for index, process in enumerate(list(self._processes)):
+                if process is not None and id(process) not in reported and not process.is_alive():
+                    reported.add(id(process))
+                    self._loop.call_soon_threadsafe(self._on_worker_exit, index, process)
+
+    def _deliver(self, message):
+        request_id, index, data, error = message
+        if request_id == "ready":
+            if error is not None:
+                if not self._ready.done():
+                    self._ready.set_exception(RuntimeError(f"inference worker {index} failed to start: {error}"))
+                return
+            if self._ready.done():
+                self._log("info", "[InferencePool] Процесс %d перезапущен.", index)
+                return
+            self._ready_count += 1
+            if self._ready_count == self.workers:
+                self._ready.set_result(True)
+            return
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return  # запрос уже завершен по таймауту или из-за падения процесса
+        future, _ = entry
+        self.in_flight[index] -= 1
+        self.completed[index] += 1
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(f"inference worker {index}: {error}"))
+        else:
+            future.set_result(data)
+
+    def _on_worker_exit(self, index: int, process):
+        """Процесс завершился: его запросы завершаются ошибкой, процесс перезапускается или выводится из работы."""
+        if self._closing or self._processes[index] is not process:
+            return
+        error = RuntimeError(f"inference worker {index} exited with code {process.exitcode}")
+        for request_id, (future, worker) in list(self._pending.items()):
+            if worker == index:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(error)
+        self.in_flight[index] = 0
+        if not self._ready.done():
+            self._ready.set_exception(error)
+            return
+        if self.restarts[index] >= self.max_restarts:
+            self.retired.add(index)
+            self._processes[index] = None
+            self._log("error", "[InferencePool] Процесс %d завершился (код %s) и выведен из работы.",
+                      index, process.exitcode)
+            return
+        self.restarts[index] += 1
+        self._log("warn", "[InferencePool] Процесс %d завершился (код %s), перезапуск %d/%d.",
+                  index, process.exitcode, self.restarts[index], self.max_restarts)
+        self._spawn(index)
+
+    def _log(self, level: str, message: str, *args):
+        if self.plogging is not None:
+            getattr(self.plogging, level)(message, *args)
+
+    async def acquire(self) -> int:
+        """Занимает слот разделяемой памяти (ждет, если все заняты)."""
+        return await self._free_slots.get()
+
+    def release(self, slot: int):
+        self._free_slots.put_nowait(slot)
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def frame_view(self, slot: int, shape: tuple) -> np.ndarray:
+        """Представление слота как кадра формы shape (запись кадра и чтение после инференса)."""
+        return np.ndarray(shape, dtype=np.uint8, buffer=self._segments[slot].buf)
+
+    async def predict(self, slot: int, shape: tuple, kwargs: dict) -> np.ndarray:
+        """Запускает predict для кадра из слота в наименее загруженном процессе; возвращает boxes.data (N x 6)."""
+        live = [i for i in range(self.workers) if i not in self.retired]
+        if not live:
+            raise RuntimeError("no live inference workers")
+        index = min(live, key=lambda i: (self.in_flight[i], self.completed[i]))
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (future, index)
+        self.in_flight[index] += 1
+        self._requests[index].put((request_id, self._segments[slot].name, tuple(shape), kwargs))
+        try:
+            return await asyncio.wait_for(future, self.request_timeout)
+        except asyncio.TimeoutError:
+            # Процесс завис: останавливаем его, дальше _on_worker_exit перезапустит его и завершит остальные запросы
+            if self._pending.pop(request_id, None) is not None:
+                self.in_flight[index] -= 1
+            process = self._processes[index]
+            if process is not None and process.is_alive():
+                self._log("warn", "[InferencePool] Процесс %d не ответил за %.0f с - остановка.",
+                          index, self.request_timeout)
+                process.terminate()
+            raise TimeoutError(f"inference worker {index} did not respond in {self.request_timeout} s") from None
+        except asyncio.CancelledError:
+            if self._pending.pop(request_id, None) is not None:
+                self.in_flight[index] -= 1
+            raise
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "in_flight": list(self.in_flight), "completed": list(self.completed),
+                "restarts": list(self.restarts), "retired": sorted(self.retired)}
+
+    def close(self, timeout: float = 5.0):
+        """
+        Останавливает процессы и удаляет слоты разделяемой памяти. Блокирует до timeout секунд на все
+        процессы вместе - из цикла событий вызывается через asyncio.to_thread (DetectionModel.stop_pool).
+        """
+        self._closing = True
+        processes = [process for process in self._processes if process is not None]
+        for requests in self._requests:
+            if requests is not None:
+                requests.put(None)
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout=1)
+        if self._results is not None:
+            self._results.put(None)
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments = []
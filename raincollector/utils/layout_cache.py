@@ -0,0 +1,95 @@
+"""
+Постоянный кэш расположения кнопок в окнах аккаунтов.
+
+Положение join_rain / rain_joined в окне браузера почти не меняется между рейнами. LayoutCache помнит,
+где метка была найдена в последний раз, для каждого профиля и геометрии окна (left, top, width, height).
+Рамки хранятся относительно окна и сохраняются в JSON, поэтому переживают перезапуск.
+Если окно профиля передвинуто или изменило размер, прежние записи профиля удаляются.
+"""
+import json
+import os
+import time
+
+
+class LayoutCache:
+    """
+    Args:
+        path: JSON-файл кэша; None - хранить только в памяти
+        max_age: сколько секунд запись считается актуальной (None - без ограничения)
+    """
+
+    def __init__(self, path: str | None = "stats/layout_cache.json", max_age: float | None = 7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # profile -> {"geometry": [left, top, width, height], "labels": {label: {"box": [x, y, w, h], "seen": ts}}}
+        self._profiles: dict = {}
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self._profiles = data
+
+    def save(self):
+        """Атомарно записывает кэш на диск (временный файл + os.replace)."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._profiles, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, profile: str, geometry: tuple[int, int, int, int]) -> dict | None:
+        entry = self._profiles.get(profile)
+        if entry is None:
+            return None
+        if tuple(entry.get("geometry", ())) != tuple(geometry):
+            # Окно передвинуто или изменило размер - прежние положения недействительны
+            del self._profiles[profile]
+            self.save()
+            return None
+        return entry
+
+    def get(self, profile: str, geometry: tuple[int, int, int, int], label: str) -> tuple[int, int, int, int] | None:
+        """Последняя рамка метки (x, y, width, height) в экранных координатах или None."""
+        entry = self._entry(profile, geometry)
+        record = entry["labels"].get(label) if entry else None
+        if record is None or (self.max_age is not None and time.time() - record["seen"] > self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        x, y, width, height = record["box"]
+        return (x + geometry[0], y + geometry[1], width, height)
+
+    def put(self, profile: str, geometry: tuple[int, int, int, int], label: str, box: tuple[int, int, int, int]):
+        """Запоминает рамку метки в экранных координатах; на диск пишет только при изменении положения."""
+        entry = self._entry(profile, geometry)
+        if entry is None:
+            entry = self._profiles[profile] = {"geometry": list(geometry), "labels": {}}
+        relative = [int(box[0]) - geometry[0], int(box[1]) - geometry[1], int(box[2]), int(box[3])]
+        previous = entry["labels"].get(label)
+        entry["labels"][label] = {"box": relative, "seen": time.time()}
+        if previous is None or previous["box"] != relative:
+            self.save()
+
+    def forget(self, profile: str, label: str | None = None):
+        """Удаляет запись метки (или всего профиля), например после промаха проверки."""
+        entry = self._profiles.get(profile)
+        if entry is None:
+            return
+        if label is None:
+            del self._profiles[profile]
+        else:
+            entry["labels"].pop(label, None)
+        self.save()
@@ -0,0 +1,315 @@
+"""
+Поиск по журналам Plogging (текущие .txt/.jsonl файлы и архивы *_archive.gz).
+
+Архивы пишутся как последовательность независимых gzip-блоков, а рядом с архивом
+лежит индекс *_archive.idx.json: для каждого блока смещение в файле, диапазон времени,
+уровни, компоненты и профили. Узкий запрос распаковывает только подходящие блоки.
+Обычный gzip.open/zcat по-прежнему читает такой архив целиком.
+
+Использование:
+  python -m raincollector.utils.logquery --logs logs --from "2026-10-17 12:00" --to "2026-10-17 12:30" --profile Profile1
+  python -m raincollector.utils.logquery --level warn error --component RainController --json
+  python -m raincollector.utils.logquery --reindex
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+INDEX_VERSION = 1
+BLOCK_RECORDS = 2000  # записей в одном gzip-блоке архива
+
+_TEXT_LINE_RE = re.compile(r"^\[(\d{2}):(\d{2}):(\d{2})\]\[([A-Z]+)\]: ?(.*)$")
+_COMPONENT_RE = re.compile(r"^\[([^\]\s:]+)(?::([^\]]+))?")
+_FILENAME_DATE_RE = re.compile(r"log_(\d{2})-(\d{2})-(\d{4})_(\d{2})-(\d{2})-(\d{2})")
+
+
+def split_component(message: str):
+    """
+    Извлекает тег компонента (и профиль) из начала сообщения:
+    "[RainController] ..." -> ("RainController", None),
+    "[BehaviorController:Profile1] ..." -> ("BehaviorController", "Profile1").
+    """
+    match = _COMPONENT_RE.match(message)
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def _file_date(path: str):
+    """Дата начала файла журнала из его имени (log_DD-MM-YYYY_HH-MM-SS...)."""
+    match = _FILENAME_DATE_RE.search(os.path.basename(path))
+    if not match:
+        return None
+    day, month, year = (int(g) for g in match.groups()[:3])
+    return datetime.date(year, month, day)
+
+
+def _iter_raw_records(lines):
+    """
+    Группирует строки файла в записи: строки текстового формата, не начинающиеся
+    с метки времени (например, traceback), относятся к предыдущей записи.
+    """
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if line.startswith("{") or _TEXT_LINE_RE.match(line):
+            if current is not None:
+                yield current
+            current = line
+        elif current is not None:
+            current += "\n" + line
+        else:
+            current = line
+    if current is not None:
+        yield current
+
+
+def parse_record(raw: str, file_date=None):
+    """
+    Разбирает запись журнала (текстовую или JSON) в словарь
+    {"ts", "level", "component", "profile", "msg"}. Возвращает None, если запись не распознана.
+    """
+    if raw.startswith("{"):
+        try:
+            record = json.loads(raw.split("\n", 1)[0])
+            record["ts"] = datetime.datetime.fromisoformat(record["ts"]).timestamp()
+            return record
+        except (ValueError, KeyError, TypeError):
+            return None
+    match = _TEXT_LINE_RE.match(raw.split("\n", 1)[0])
+    if not match:
+        return None
+    hour, minute, second, level, text = match.groups()
+    text = text + raw[len(match.group(0)):]
+    date = file_date or datetime.date.today()
+    ts = datetime.datetime.combine(date, datetime.time(int(hour), int(minute), int(second))).timestamp()
+    component, profile = split_component(text)
+    return {"ts": ts, "level": level.lower(), "component": component, "profile": profile, "msg": text}
+
+
+def write_indexed_archive(src_path: str, archive_path: str, index_path: str):
+    """
+    Потоково сжимает файл журнала в архив из независимых gzip-блоков по BLOCK_RECORDS записей
+    и записывает рядом индекс блоков. Файлы создаются через временные имена.
+    """
+    file_date = _file_date(src_path)
+    blocks = []
+    tmp_archive = f"{archive_path}.tmp"
+    tmp_index = f"{index_path}.tmp"
+
+    def _flush_block(out, raw_records, meta):
+        data = ("\n".join(raw_records) + "\n").encode("utf-8")
+        member = gzip.compress(data)
+        meta["offset"] = out.tell()
+        meta["length"] = len(member)
+        meta["records"] = len(raw_records)
+        meta["levels"] = sorted(meta["levels"])
+        meta["components"] = sorted(meta["components"])
+        meta["profiles"] = sorted(meta["profiles"])
+        out.write(member)
+        blocks.append(meta)
+
+    def _new_meta():
+        return {"start": None, "end": None, "levels": set(), "components": set(), "profiles": set()}
+
+    with open(src_path, "r", encoding="utf-8", errors="replace") as f_in, open(tmp_archive, "wb") as f_out:
+        raw_records = []
+        meta = _new_meta()
+        for raw in _iter_raw_records(f_in):
+            record = parse_record(raw, file_date)
+            if record is not None:
+                ts = record["ts"]
+                meta["start"] = ts if meta["start"] is None else min(meta["start"], ts)
+                meta["end"] = ts if meta["end"] is None else max(meta["end"], ts)
+                meta["levels"].add(record.get("level"))
+                if record.get("component"):
+                    meta["components"].add(record["component"])
+                if record.get("profile"):
+                    meta["profiles"].add(record["profile"])
+            raw_records.append(raw)
+            if len(raw_records) >= BLOCK_RECORDS:
+                _flush_block(f_out, raw_records, meta)
+                raw_records = []
+                meta = _new_meta()
+        if raw_records:
+            _flush_block(f_out, raw_records, meta)
+
+    index = {
+        "version": INDEX_VERSION,
+        "source": os.path.basename(src_path),
+        "blocks": blocks,
+    }
+    with open(tmp_index, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_archive, archive_path)
+    os.replace(tmp_index, index_path)
+
+
+def index_path_for(archive_path: str) -> str:
+    """Путь к индексу для архива *_archive.gz."""
+    return f"{archive_path[:-3]}.idx.json"
+
+
+def reindex_archive(archive_path: str):
+    """Перепаковывает старый архив (один gzip-поток без индекса) в блочный архив с индексом."""
+    tmp_src = f"{archive_path}.src.tmp"  # имя сохраняет дату файла для разбора времени
+    try:
+        with gzip.open(archive_path, "rb") as f_in, open(tmp_src, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        write_indexed_archive(tmp_src, archive_path, index_path_for(archive_path))
+    finally:
+        if os.path.exists(tmp_src):
+            os.remove(tmp_src)
+
+
+def _record_matches(record, start, end, levels, profiles, components, text):
+    if record is None:
+        return False
+    if start is not None and record["ts"] < start:
+        return False
+    if end is not None and record["ts"] > end:
+        return False
+    if levels and record.get("level") not in levels:
+        return False
+    if profiles and record.get("profile") not in profiles:
+        return False
+    if components and record.get("component") not in components:
+        return False
+    if text and text not in record.get("msg", ""):
+        return False
+    return True
+
+
+def _block_matches(block, start, end, levels, profiles, components):
+    if block["start"] is None:
+        return True  # нераспознанные записи, проверяем построчно
+    if start is not None and block["end"] < start:
+        return False
+    if end is not None and block["start"] > end:
+        return False
+    if levels and not set(levels) & set(block["levels"]):
+        return False
+    if profiles and not set(profiles) & set(block["profiles"]):
+        return False
+    if components and not set(components) & set(block["components"]):
+        return False
+    return True
+
+
+def _scan_lines(lines, file_date, filters):
+    return [
+        record for record in (parse_record(raw, file_date) for raw in _iter_raw_records(lines))
+        if _record_matches(record, *filters)
+    ]
+
+
+def _query_file(path: str, filters: tuple):
+    """Ищет записи в одном файле журнала. Выполняется в процессе-исполнителе."""
+    file_date = _file_date(path)
+    if path.endswith(".gz"):
+        index_path = index_path_for(path)
+        if not os.path.exists(index_path):
+            with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+                return _scan_lines(f, file_date, filters)
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        start, end, levels, profiles, components, _ = filters
+        results = []
+        with open(path, "rb") as f:
+            for block in index["blocks"]:
+                if not _block_matches(block, start, end, levels, profiles, components):
+                    continue
+                f.seek(block["offset"])
+                data = zlib.decompress(f.read(block["length"]), 16 + zlib.MAX_WBITS)
+                results.extend(_scan_lines(data.decode("utf-8", errors="replace").splitlines(), file_date, filters))
+        return results
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return _scan_lines(f, file_date, filters)
+
+
+def find_log_files(logs_dir: str = "logs"):
+    """Возвращает все файлы журнала и архивы в папке логов (рекурсивно)."""
+    paths = []
+    for root, _, files in os.walk(logs_dir):
+        for file in files:
+            if file.endswith((".txt", ".jsonl", "_archive.gz")) and file.startswith("log_"):
+                paths.append(os.path.join(root, file))
+    return sorted(paths)
+
+
+def query_logs(logs_dir: str = "logs", start: float = None, end: float = None, levels=None,
+               profiles=None, components=None, text: str = None, max_workers: int = None) -> list:
+    """
+    Ищет записи журнала по диапазону времени (timestamp), уровням, профилям, компонентам
+    и подстроке. Файлы обрабатываются параллельно в отдельных процессах.
+    Возвращает записи, отсортированные по времени.
+    """
+    filters = (start, end, set(levels or ()), set(profiles or ()), set(components or ()), text)
+    paths = find_log_files(logs_dir)
+    if start is not None or end is not None:
+        # Файл не может содержать записи раньше даты в своем имени
+        end_date = datetime.date.fromtimestamp(end) if end is not None else None
+        paths = [p for p in paths if end_date is None or _file_date(p) is None or _file_date(p) <= end_date]
+    if not paths:
+        return []
+    results = []
+    if len(paths) == 1 or max_workers == 1:
+        for path in paths:
+            results.extend(_query_file(path, filters))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for records in executor.map(_query_file, paths, [filters] * len(paths)):
+                results.extend(records)
+    results.sort(key=lambda record: record["ts"])
+    return results
+
+
+def _parse_time(value: str) -> float:
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск по журналам Plogging")
+    parser.add_argument("--logs", default="logs", help="папка логов")
+    parser.add_argument("--from", dest="start", type=_parse_time, help="начало диапазона (ISO, например 2026-10-17 12:00)")
+    parser.add_argument("--to", dest="end", type=_parse_time, help="конец диапазона (ISO)")
+    parser.add_argument("--level", nargs="+", help="уровни: debug info warn error")
+    parser.add_argument("--profile", nargs="+", help="имена профилей")
+    parser.add_argument("--component", nargs="+", help="теги компонентов, например RainController WS")
+    parser.add_argument("--text", help="подстрока в сообщении")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    parser.add_argument("--json", action="store_true", help="выводить записи в формате JSON lines")
+    parser.add_argument("--reindex", action="store_true", help="построить индексы для старых архивов")
+    args = parser.parse_args(argv)
+
+    if args.reindex:
+        for path in find_log_files(args.logs):
+            if path.endswith(".gz") and not os.path.exists(index_path_for(path)):
+                reindex_archive(path)
+                print(f"Reindexed {path}")
+        return 0
+
+    records = query_logs(args.logs, args.start, args.end, args.level, args.profile,
+                         args.component, args.text, args.workers)
+    for record in records:
+        if args.json:
+            line = dict(record)
+            line["ts"] = datetime.datetime.fromtimestamp(record["ts"]).isoformat(timespec="milliseconds")
+            sys.stdout.write(json.dumps(line, ensure_ascii=False) + "\n")
+        else:
+            ts = datetime.datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+            sys.stdout.write(f"[{ts}][{str(record.get('level')).upper()}]: {record.get('msg')}\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
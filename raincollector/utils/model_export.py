@@ -0,0 +1,210 @@
+"""
+Экспорт модели YOLO в CPU-оптимизированные форматы и проверка перед использованием.
+
+Поддерживаемые бэкенды DetectionModel:
+- pt            - исходная модель PyTorch (best.pt)
+- onnx          - ONNX Runtime (best.onnx)
+- openvino      - OpenVINO FP32 (best_openvino_model/)
+- openvino-int8 - OpenVINO с INT8-квантованием (best_int8_openvino_model/), нужен калибровочный датасет (--data)
+
+Экспорт выполняется один раз, артефакт сохраняется рядом с best.pt. Затем детекции и задержка
+сравниваются с .pt на наборе кадров; результат записывается в <артефакт>.verified.json.
+DetectionModel использует экспортированный бэкенд, только если проверка пройдена для текущего best.pt,
+иначе загружает .pt.
+
+Использование:
+  python -m raincollector.utils.model_export --model best.pt --backend onnx --samples frames/
+  python -m raincollector.utils.model_export --model best.pt --backend openvino-int8 --data calib.yaml --samples frames/
+  python -m raincollector.utils.model_export --model best.pt --backend openvino --samples frames/ --verify-only
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKENDS = {
+    # бэкенд: (формат ultralytics, суффикс артефакта, INT8)
+    "onnx": ("onnx", ".onnx", False),
+    "openvino": ("openvino", "_openvino_model", False),
+    "openvino-int8": ("openvino", "_int8_openvino_model", True),
+}
+
+
+def artifact_path(model_path: str, backend: str) -> str:
+    """Путь к экспортированному артефакту рядом с исходной моделью (так его называет ultralytics)."""
+    _, suffix, _ = BACKENDS[backend]
+    return os.path.splitext(model_path)[0] + suffix
+
+
+def marker_path(artifact: str) -> str:
+    return artifact.rstrip("/\\") + ".verified.json"
+
+
+def _source_stamp(model_path: str) -> dict:
+    stat = os.stat(model_path)
+    return {"source": os.path.basename(model_path), "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def export_model(model_path: str, backend: str, data: str = None, imgsz: int = 640) -> str:
+    """Экспортирует модель в формат бэкенда и возвращает путь к артефакту."""
+    from ultralytics import YOLO
+    fmt, _, int8 = BACKENDS[backend]
+    kwargs = {"format": fmt, "imgsz": imgsz, "dynamic": True}  # dynamic: батчи и кадры разного размера
+    if int8:
+        if not data:
+            raise ValueError("INT8 quantization requires a calibration dataset (--data)")
+        kwargs.update(int8=True, data=data)
+    exported = YOLO(model_path).export(**kwargs)
+    artifact = artifact_path(model_path, backend)
+    if os.path.normpath(str(exported)) != os.path.normpath(artifact):
+        os.replace(exported, artifact)
+    return artifact
+
+
+def _load_samples(samples: str) -> list:
+    from raincollector.utils.capture import ReplayCapture
+    replay = ReplayCapture(samples, loop=False)
+    return [replay.grab() for _ in range(len(replay))]
+
+
+def box_iou(a, b) -> float:
+    """IoU двух рамок (x1, y1, x2, y2)."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def detection_agreement(reference: list, candidate: list, iou_threshold: float) -> float:
+    """Доля совпавших детекций (тот же класс и IoU >= порога) от большего из двух наборов."""
+    if not reference and not candidate:
+        return 1.0
+    unmatched = list(candidate)
+    matched = 0
+    for cls, box in reference:
+        best, best_iou = None, iou_threshold
+        for item in unmatched:
+            if item[0] == cls:
+                iou = box_iou(box, item[1])
+                if iou >= best_iou:
+                    best, best_iou = item, iou
+        if best is not None:
+            unmatched.remove(best)
+            matched += 1
+    return matched / max(len(reference), len(candidate))
+
+
+def _run(model, frames: list, conf: float, imgsz: int):
+    """Прогоняет кадры через модель; возвращает детекции [(cls, xyxy), ...] по кадрам и задержки в мс."""
+    for frame in frames[:2]:
+        model.predict(frame, conf=conf, imgsz=imgsz, verbose=False)  # прогрев
+    detections, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        result = model.predict(frame, conf=conf, imgsz=imgsz, verbose=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        boxes = result.boxes
+        detections.append(list(zip(boxes.cls.tolist(), boxes.xyxy.tolist())))
+    return detections, latencies
+
+
+def verify_backend(model_path: str, backend: str, samples: str, conf: float = 0.7, imgsz: int = 640,
+                   iou_threshold: float = 0.5, min_agreement: float = 0.95, max_latency_ratio: float = 1.0) -> dict:
+    """
+    Сравнивает экспортированный бэкенд с .pt на наборе кадров (папка изображений или .npy).
+    Проверка пройдена, если средняя доля совпавших детекций >= min_agreement, а медианная задержка
+    бэкенда не больше медианной задержки .pt, умноженной на max_latency_ratio.
+    Отчет записывается в <артефакт>.verified.json и возвращается.
+    """
+    from ultralytics import YOLO
+    artifact = artifact_path(model_path, backend)
+    frames = _load_samples(samples)
+
+    reference, pt_latencies = _run(YOLO(model_path), frames, conf, imgsz)
+    candidate, backend_latencies = _run(YOLO(artifact, task="detect"), frames, conf, imgsz)
+
+    agreements = [detection_agreement(ref, cand, iou_threshold) for ref, cand in zip(reference, candidate)]
+    agreement = statistics.fmean(agreements)
+    pt_p50 = statistics.median(pt_latencies)
+    backend_p50 = statistics.median(backend_latencies)
+
+    report = {
+        "backend": backend,
+        **_source_stamp(model_path),
+        "samples": len(frames),
+        "agreement": round(agreement, 4),
+        "min_frame_agreement": round(min(agreements), 4),
+        "latency_ms": {"pt_p50": round(pt_p50, 2), "backend_p50": round(backend_p50, 2)},
+        "passed": agreement >= min_agreement and backend_p50 <= pt_p50 * max_latency_ratio,
+        "verified_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(marker_path(artifact), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report
+
+
+def resolve_model_path(model_path: str, backend: str = "pt", logger=None) -> str:
+    """
+    Возвращает путь к модели для загрузки: артефакт бэкенда, если он экспортирован и прошел
+    проверку для текущего model_path, иначе сам model_path.
+    """
+    if backend in (None, "pt"):
+        return model_path
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+
+    artifact = artifact_path(model_path, backend)
+    reason = None
+    if not os.path.exists(artifact):
+        reason = "артефакт не найден"
+    else:
+        try:
+            with open(marker_path(artifact), "r", encoding="utf-8") as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            report = None
+        if report is None:
+            reason = "проверка не выполнялась"
+        elif not report.get("passed"):
+            reason = "проверка не пройдена"
+        elif any(report.get(key) != value for key, value in _source_stamp(model_path).items()):
+            reason = "исходная модель изменилась после проверки"
+
+    if reason:
+        if logger:
+            logger.warn(f"[DetectionModel] Бэкенд {backend} недоступен ({reason}), используется {model_path}.")
+        return model_path
+    if logger:
+        logger.info(f"[DetectionModel] Используется бэкенд {backend}: {artifact}")
+    return artifact
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Экспорт и проверка бэкендов инференса YOLO")
+    parser.add_argument("--model", default="best.pt", help="исходная модель .pt")
+    parser.add_argument("--backend", required=True, choices=sorted(BACKENDS), help="целевой бэкенд")
+    parser.add_argument("--samples", required=True, help="папка с кадрами или .npy для проверки")
+    parser.add_argument("--data", help="калибровочный датасет (yaml) для INT8")
+    parser.add_argument("--imgsz", type=int, default=640, help="размер входа модели")
+    parser.add_argument("--conf", type=float, default=0.7, help="порог уверенности при сравнении")
+    parser.add_argument("--min-agreement", type=float, default=0.95, help="минимальная доля совпавших детекций")
+    parser.add_argument("--max-latency-ratio", type=float, default=1.0,
+                        help="допустимое отношение задержки бэкенда к задержке .pt")
+    parser.add_argument("--verify-only", action="store_true", help="не экспортировать, только проверить")
+    args = parser.parse_args(argv)
+
+    if not args.verify_only:
+        artifact = export_model(args.model, args.backend, data=args.data, imgsz=args.imgsz)
+        print(f"Exported {artifact}")
+    report = verify_backend(args.model, args.backend, args.samples, conf=args.conf, imgsz=args.imgsz,
+                            min_agreement=args.min_agreement, max_latency_ratio=args.max_latency_ratio)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
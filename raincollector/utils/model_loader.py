@@ -0,0 +1,57 @@
+"""
+Фоновая загрузка и прогрев DetectionModel при запуске.
+
+Загрузка весов (и импорт ultralytics/torch) выполняется в отдельном потоке, пока main() открывает
+браузеры и принимает подключения расширений. Затем модель прогревается на пустом кадре в своем потоке
+инференса, чтобы первая настоящая детекция во время рейна не платила за создание предиктора
+и выделение памяти. load_detection_model возвращает future готовности, который ждет RainController.
+"""
+import asyncio
+import time
+from raincollector.utils.plogging import Plogging
+
+
+def _create_model(model_path: str, logger: Plogging, kwargs: dict):
+    # Импорт здесь: ultralytics и torch загружаются в фоновом потоке, а не при импорте main.py
+    from raincollector.utils.vision import DetectionModel
+    return DetectionModel(model_path, logger, **kwargs)
+
+
+def load_detection_model(model_path: str, logger: Plogging, warmup: bool = True,
+                         warmup_size: tuple[int, int] = (720, 1280), pool_workers: int = 0,
+                         **kwargs) -> asyncio.Future:
+    """
+    Запускает загрузку DetectionModel в фоне; вызывается из работающего цикла событий.
+
+    Args:
+        model_path, logger, kwargs: аргументы DetectionModel
+        warmup: выполнить прогревочный инференс после загрузки
+        warmup_size: (height, width) прогревочного кадра
+        pool_workers: запустить пул из стольких процессов инференса (DetectionModel.start_pool); 0 - без пула
+
+    Returns:
+        Future, который завершается готовой моделью (или исключением загрузки).
+    """
+    async def _load():
+        start = time.perf_counter()
+        logger.info(f"[ModelLoader] Загрузка модели {model_path} в фоне...")
+        try:
+            model = await asyncio.to_thread(_create_model, model_path, logger, kwargs)
+            loaded = time.perf_counter()
+            logger.info("[ModelLoader] Модель загружена за %.2f сек (бэкенд %s).", loaded - start, model.backend)
+            if warmup:
+                latencies = await model.inference.run(model.warmup, *warmup_size)
+                logger.info("[ModelLoader] Прогрев: первый инференс %.1f мс, повторный %.1f мс.",
+                            latencies[0], latencies[-1])
+            if pool_workers:
+                pool_start = time.perf_counter()
+                await model.start_pool(pool_workers)
+                logger.info("[ModelLoader] Пул инференса: %d процессов за %.2f сек.",
+                            pool_workers, time.perf_counter() - pool_start)
+        except Exception as e:
+            logger.error(f"[ModelLoader] ❌ Не удалось загрузить модель {model_path}: {e}")
+            raise
+        logger.info("[ModelLoader] ✅ Модель готова через %.2f сек после запуска загрузки.", time.perf_counter() - start)
+        return model
+
+    return asyncio.ensure_future(_load())
@@ -1,8 +1,14 @@
 import asyncio
+import atexit
 import os
-import gzip
+import sys
+import threading
+import time
 import datetime
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from raincollector.utils.logquery import split_component, write_indexed_archive, index_path_for
 
 class Signal:
     def __init__(self):
@@ -18,6 +24,167 @@ class Signal:
             slot(*args, **kwargs)
 
 
+# Числовые значения уровней для сравнения с порогами приемников
+LOG_LEVELS = {
+    'debug': 10,
+    'info': 20,
+    'warn': 30,
+    'error': 40,
+}
+# Приемники записей: файлы журнала, консоль и история для WebSocket
+LOG_SINKS = ('file', 'console', 'websocket')
+# Форматы файлов журнала: текстовые строки или JSON lines (ts, level, component, profile, msg)
+LOG_FORMATS = {
+    'text': '.txt',
+    'json': '.jsonl',
+}
+
+
+class LogHistory:
+    """
+    Кольцевой буфер истории логов фиксированного размера.
+    Каждой записи присваивается возрастающий порядковый номер (seq), по которому
+    подписчики могут забирать только новые записи вместо копирования всей истории.
+    Записи добавляет поток писателя, а читают и меняют размер другие потоки,
+    поэтому все операции выполняются под блокировкой.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self._capacity = capacity
+        self._buffer = [None] * capacity
+        self._next_seq = 0  # номер следующей записи
+        self._first_seq = 0  # номер самой старой сохраненной записи
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def first_seq(self) -> int:
+        """Номер самой старой записи, которая еще хранится в буфере."""
+        return self._first_seq
+
+    @property
+    def last_seq(self) -> int:
+        """Номер последней добавленной записи (-1, если записей не было)."""
+        return self._next_seq - 1
+
+    def append(self, message) -> int:
+        """Добавляет запись за O(1), вытесняя самую старую. Возвращает номер записи."""
+        with self._lock:
+            seq = self._next_seq
+            self._buffer[seq % self._capacity] = message
+            self._next_seq = seq + 1
+            if self._next_seq - self._first_seq > self._capacity:
+                self._first_seq += 1
+            return seq
+
+    def since(self, seq: int = -1, limit: int = None) -> list:
+        """
+        Возвращает записи с номером больше seq в виде списка (seq, message).
+        Если часть записей уже вытеснена из буфера, возвращаются только сохранившиеся.
+        """
+        with self._lock:
+            return self._since(seq, limit)
+
+    def _since(self, seq: int, limit: int = None) -> list:
+        start = max(seq + 1, self._first_seq)
+        end = self._next_seq
+        if limit is not None:
+            end = min(end, start + limit)
+        return [(i, self._buffer[i % self._capacity]) for i in range(start, end)]
+
+    def last(self):
+        with self._lock:
+            if self._next_seq == 0:
+                raise IndexError("log history is empty")
+            return self._buffer[(self._next_seq - 1) % self._capacity]
+
+    def resize(self, capacity: int):
+        """Меняет размер буфера, сохраняя самые новые записи и их номера."""
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        with self._lock:
+            entries = self._since(self._next_seq - 1 - capacity)
+            buffer = [None] * capacity
+            for seq, message in entries:
+                buffer[seq % capacity] = message
+            self._buffer = buffer
+            self._capacity = capacity
+            self._first_seq = max(self._first_seq, self._next_seq - capacity)
+
+    def clear(self):
+        with self._lock:
+            self._buffer = [None] * self._capacity
+            self._next_seq = 0
+            self._first_seq = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._next_seq - self._first_seq
+
+    def __iter__(self):
+        for _, message in self.since():
+            yield message
+
+
+class LogSubscription:
+    """
+    Подписка на живой поток записей логов для одного потребителя (например, дашборда по WebSocket).
+    Писатель только добавляет записи в ограниченную очередь: при переполнении вытесняются
+    самые старые записи, поэтому медленный потребитель никогда не тормозит логирование.
+    """
+
+    def __init__(self, owner, maxsize: int, loop: asyncio.AbstractEventLoop):
+        self._owner = owner
+        self._queue = deque(maxlen=maxsize)
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._notified = False  # уже запланировано пробуждение потребителя
+        self._lock = threading.Lock()
+        self.dropped = 0  # вытеснено записей с последнего get()
+        self.closed = False
+
+    def _push(self, records):
+        """Вызывается из потока писателя: добавляет записи без блокировки на потребителе."""
+        with self._lock:
+            overflow = len(self._queue) + len(records) - self._queue.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self._queue.extend(records)
+            if self._notified:
+                return
+            self._notified = True
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            pass  # цикл событий уже закрыт
+
+    async def get(self, max_items: int = 100):
+        """
+        Ждет новые записи и возвращает кортеж (records, dropped), где dropped - число записей,
+        вытесненных из очереди с прошлого вызова. После close() возвращает ([], 0).
+        """
+        while True:
+            with self._lock:
+                if self._queue or self.closed:
+                    records = [self._queue.popleft() for _ in range(min(max_items, len(self._queue)))]
+                    dropped, self.dropped = self.dropped, 0
+                    return records, dropped
+                self._notified = False
+                self._event.clear()
+            await self._event.wait()
+
+    def close(self):
+        """Отписывается от потока и будит ожидающего потребителя."""
+        self.closed = True
+        self._owner._unsubscribe(self)
+        self._event.set()
+
+
 class Plogging:
     _instance = None  # Class-level instance
     _initialized = False  # To prevent re-initialization
@@ -36,12 +203,14 @@ class Plogging:
         
         
         self.last_log_date = self._get_current_date()
-        self.log_history = []
+        self.history_size = 1000  # максимальное число записей в истории для WebSocket
+        self.log_history = LogHistory(self.history_size)
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
         # Flag to prevent recursion in logging
         self.recursion_guard = False
         self.last_log_message = ""
+        # Вызывается из потока писателя; обработчикам, работающим с asyncio, нужен loop.call_soon_threadsafe
         self.on_log_message = Signal()
         # Settings for folders for different log levels
         self.log_folders = {
@@ -63,30 +232,86 @@ class Plogging:
             'debug': True,
             'warn': True,
         }
+        # Очередь записей для фонового писателя: вызовы info/debug/... только добавляют запись.
+        # deque.append потокобезопасен, поэтому логировать можно из любого потока и до запуска цикла событий.
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._writer_thread = None
+        self._stopping = False
+        self._write_lock = threading.RLock()  # писатель, flush() и ротация не пересекаются
+        # Открытые файлы журнала: путь -> дескриптор (уровни с одной папкой делят один дескриптор)
+        self._handles = {}
+        self._time_cache = (None, "")  # (секунда, "%H:%M:%S") чтобы не вызывать strftime на каждую запись
+        # Ротация: по наступлению полуночи или при превышении размера файла, сжатие в отдельном потоке
+        self._rotate_at = self._next_midnight()
+        self._file_sizes = {}  # путь -> записано байт
+        self.max_file_size = 50 * 1024 * 1024  # байт, после которых файлы журнала ротируются
+        self._archive_executor = None
+        self.flush_interval = 0.25  # сек, максимальная задержка записи на диск и в консоль
+        self.flush_batch_size = 256  # записей в очереди, после которых писатель будится досрочно
+        self.console_output = True
+        # Минимальный уровень для каждого приемника; записи ниже порога всех приемников не создаются
+        self.sink_levels = {sink: 'debug' for sink in LOG_SINKS}
+        self.log_format = 'text'
+        # Подавление повторов: одинаковые сообщения из одного места кода в пределах окна
+        # сворачиваются в одну строку со счетчиком. 0 - отключено.
+        self.dedup_window = 5.0  # сек
+        self._repeats = {}  # (место вызова, текст) -> [начало окна, подавлено, время последнего, level, profile]
+        # Лимиты по компонентам (token bucket): компонент -> [rate, burst, токены, время, отброшено]
+        self._rate_limits = {}
+        # Живые подписки на поток записей (список заменяется целиком, писатель читает его без блокировки)
+        self._subscriptions = []
+        self._enabled_levels = {level: True for level in LOG_LEVELS}
         # Load settings from file if it exists
         self.load_log_settings()
+        self._update_enabled_levels()
+        atexit.register(self.close)
         self._initialized = True  # Mark as initialized
 
     def _get_log_filename(self):
         """Возвращает имя файла журнала на основе текущего времени."""
         time_now_logs = datetime.datetime.now()
         formatted_time_logs = time_now_logs.strftime("%d-%m-%Y_%H-%M-%S")
-        return f"log_{formatted_time_logs}.txt"
+        return f"log_{formatted_time_logs}{LOG_FORMATS[self.log_format]}"
 
-    def create_log_file(self, level):
+    def create_log_file(self, level, log_filename=None):
         """Создает новый файл журнала для указанного уровня и возвращает путь к нему."""
-        log_filename = self._get_log_filename()
+        if log_filename is None:
+            log_filename = self._get_log_filename()
         folder = os.path.normpath(self.log_folders[level])  # Нормализуем путь папки
         if not os.path.exists(folder):
             os.makedirs(folder)
+        old_path = self.log_filepaths[level]
         self.log_filepaths[level] = os.path.join(folder, log_filename)
+        # Закрываем старый дескриптор, если им больше не пользуется ни один уровень
+        if old_path and old_path not in self.log_filepaths.values():
+            self._close_handle(old_path)
+        if os.path.exists(self.log_filepaths[level]):
+            return self.log_filepaths[level]  # Файл уже создан другим уровнем из той же папки
         
         try:
             with open(self.log_filepaths[level], 'w') as f:
                 pass
+            self._file_sizes[self.log_filepaths[level]] = 0
             print(f"Log file created: {self.log_filepaths[level]} for level: {level}")
         except Exception as e:
             print(f"Error on creating log file: {e}")
+        return self.log_filepaths[level]
+
+    def _create_log_files(self):
+        """Создает новые файлы журнала для всех уровней с общим именем (одна папка - один файл)."""
+        log_filename = self._get_log_filename()
+        # При повторной ротации в ту же секунду добавляем суффикс, чтобы не дописывать в старый файл
+        base, ext = os.path.splitext(log_filename)
+        folders = set(os.path.normpath(folder) for folder in self.log_folders.values())
+        suffix = 1
+        while any(os.path.exists(os.path.join(folder, log_filename))
+                  or os.path.exists(os.path.join(folder, f"{os.path.splitext(log_filename)[0]}_archive.gz"))
+                  for folder in folders):
+            log_filename = f"{base}_{suffix}{ext}"
+            suffix += 1
+        for level in self.log_filepaths.keys():
+            self.create_log_file(level, log_filename)
 
     def set_folders(self, info=None, error=None, debug=None, warn=None):
         """
@@ -106,48 +331,151 @@ class Plogging:
         self.save_log_settings()
 
     def archive_logs(self):
-        """Архивирует старые файлы журнала и удаляет их."""
-        for level, folder in self.log_folders.items():
-            # Нормализуем путь
-            folder = os.path.normpath(folder)
+        """
+        Архивирует старые файлы журнала и удаляет их.
+        Сжатие выполняется в фоновом потоке; текущие открытые файлы журнала не трогаются.
+        Возвращает Future, который завершается после архивации всех найденных файлов.
+        """
+        active = set(path for path in self.log_filepaths.values() if path)
+        folders = set(os.path.normpath(folder) for folder in self.log_folders.values())
+        return self._get_archive_executor().submit(self._archive_folders, folders, active)
+
+    def _get_archive_executor(self):
+        if self._archive_executor is None:
+            self._archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plogging-archive")
+        return self._archive_executor
+
+    def _archive_folders(self, folders, active):
+        """Выполняется в потоке архивации: сжимает все файлы журнала папок, кроме активных."""
+        for folder in folders:
             if not os.path.exists(folder):
                 print(f"Folder '{folder}' does not exist. Skipping...")
                 continue
 
-            log_files = [file for file in os.listdir(folder) if file.endswith(".txt")]
+            for file in os.listdir(folder):
+                path = os.path.join(folder, file)
+                if file.endswith(tuple(LOG_FORMATS.values())) and path not in active:
+                    self._archive_file(path)
 
-            if log_files:
-                for file in log_files:
-                    archive_filename = f"{file[:-4]}_archive.gz"
-                    archive_filepath = os.path.join(folder, archive_filename)
-
-                    with open(os.path.join(folder, file), 'rb') as f_in, gzip.open(archive_filepath, 'wb') as f_out:
-                        f_out.writelines(f_in)
-                    
-                    os.remove(os.path.join(folder, file))
-                    print(f"Log file {file} successfully zipped in {archive_filepath}")
+    @staticmethod
+    def _archive_file(path):
+        """Потоково сжимает файл журнала в блочный gzip-архив с индексом и удаляет исходный файл."""
+        archive_filepath = f"{os.path.splitext(path)[0]}_archive.gz"
+        try:
+            # Архив и индекс появляются под итоговыми именами только после полной записи
+            write_indexed_archive(path, archive_filepath, index_path_for(archive_filepath))
+            os.remove(path)
+            print(f"Log file {os.path.basename(path)} successfully zipped in {archive_filepath}")
+        except Exception as e:
+            print(f"Error archiving log file {path}: {e}")
 
     def set_websocket_settings(self, info=True, error=True, debug=True, warn=True):
-        """Настраивает параметры WebSocket для каждого уровня логов."""
+        """
+        Настраивает параметры WebSocket для каждого уровня логов: попадают ли записи уровня в историю
+        (get_history_since, LOG_HISTORY) и вызывается ли on_log_message. Живые подписки (subscribe)
+        от этих настроек не зависят - для них действует только порог приемника 'websocket'.
+        """
         self._wb_translate = {
             'info': info,
             'error': error,
             'debug': debug,
             'warn': warn,
         }
+        self._update_enabled_levels()
         # Сохраняем обновленные настройки WebSocket
         self.save_log_settings()
+
+    def set_level(self, level, sink=None):
+        """
+        Задает минимальный уровень логов для приемника ('file', 'console', 'websocket').
+        Если sink не указан, порог применяется ко всем приемникам.
+        """
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level: {level}")
+        sinks = LOG_SINKS if sink is None else (sink,)
+        for name in sinks:
+            if name not in self.sink_levels:
+                raise ValueError(f"Unknown log sink: {name}")
+            self.sink_levels[name] = level
+        self._update_enabled_levels()
+        self.save_log_settings()
+
+    def set_log_format(self, log_format):
+        """
+        Задает формат файлов журнала: 'text' или 'json' (JSON lines).
+        Новый формат применяется к файлам, созданным после вызова (enable_logging или ротация).
+        """
+        if log_format not in LOG_FORMATS:
+            raise ValueError(f"Unknown log format: {log_format}")
+        self.log_format = log_format
+        self.save_log_settings()
+
+    def set_console_output(self, enabled: bool):
+        """Включает или отключает вывод логов в консоль."""
+        self.console_output = enabled
+        self._update_enabled_levels()
+
+    def _sink_accepts(self, sink, level):
+        return LOG_LEVELS[level] >= LOG_LEVELS[self.sink_levels[sink]]
+
+    def _update_enabled_levels(self):
+        """Пересчитывает, для каких уровней хотя бы один приемник примет запись."""
+        for level in LOG_LEVELS:
+            self._enabled_levels[level] = (
+                self._sink_accepts('file', level)
+                or (self.console_output and self._sink_accepts('console', level))
+                or ((self._wb_translate[level] == True or bool(self._subscriptions))
+                    and self._sink_accepts('websocket', level))
+            )
+
+    def is_enabled_for(self, level):
+        """Возвращает True, если запись этого уровня попадет хотя бы в один приемник."""
+        return self._enabled_levels[level]
         
     def enable_logging(self):
-        """Включает логирование, архивирует старые файлы и создает новый файл журнала для всех уровней."""
+        """
+        Включает логирование: создает новый файл журнала для всех уровней
+        и запускает фоновую архивацию старых файлов (запуск ее не дожидается).
+        """
+        with self._write_lock:
+            self._close_handles()
+            self._create_log_files()
+            self._rotate_at = self._next_midnight()
+            self.last_log_date = self._get_current_date()
         self.archive_logs()
-        for level in self.log_filepaths.keys():
-            self.create_log_file(level)
 
     def _get_current_date(self):
         """Возвращает текущую дату в формате YYYY-MM-DD."""
         return datetime.datetime.now().strftime("%Y-%m-%d")
 
+    @staticmethod
+    def _next_midnight():
+        """Возвращает timestamp ближайшей полуночи по местному времени."""
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        return datetime.datetime.combine(tomorrow, datetime.time.min).timestamp()
+
+    def _rotate(self):
+        """Закрывает текущие файлы, создает новые и отдает старые на сжатие в фоновый поток."""
+        old_paths = set(path for path in self.log_filepaths.values() if path)
+        self._close_handles()
+        self._create_log_files()
+        self._rotate_at = self._next_midnight()
+        self.last_log_date = self._get_current_date()
+        executor = self._get_archive_executor()
+        for path in old_paths - set(self.log_filepaths.values()):
+            self._file_sizes.pop(path, None)
+            executor.submit(self._archive_file, path)
+
+    def _maybe_rotate(self):
+        """Проверка ротации писателем: одно сравнение времени и размеров вместо strftime на запись."""
+        if time.time() >= self._rotate_at:
+            self._rotate()
+            return
+        for path in self._handles:
+            if self._file_sizes.get(path, 0) >= self.max_file_size:
+                self._rotate()
+                return
+
     def save_log_settings(self):
         """Сохраняет текущие настройки папок логов в JSON файл."""
         # Нормализуем пути перед сохранением
@@ -163,7 +491,10 @@ class Plogging:
                 'error': self._wb_translate['error'],
                 'debug': self._wb_translate['debug'],
                 'warn': self._wb_translate['warn'],
-            }
+            },
+            'history_size': self.history_size,
+            'sink_levels': dict(self.sink_levels),
+            'log_format': self.log_format,
         }
         try:
             with open(self.config_file, 'w') as json_file:
@@ -192,57 +523,365 @@ class Plogging:
                     self._wb_translate['debug'] = settings.get('websocket_settings', {}).get('debug', True)
                     self._wb_translate['warn'] = settings.get('websocket_settings', {}).get('warn', True)
 
+                    # Загружаем размер истории
+                    self.history_size = int(settings.get('history_size', self.history_size))
+                    self.log_history.resize(self.history_size)
+
+                    # Загружаем пороги уровней приемников
+                    for sink, level in settings.get('sink_levels', {}).items():
+                        if sink in self.sink_levels and level in LOG_LEVELS:
+                            self.sink_levels[sink] = level
+
+                    # Загружаем формат файлов журнала
+                    if settings.get('log_format') in LOG_FORMATS:
+                        self.log_format = settings['log_format']
+
                     print(f"Log and WebSocket settings loaded from {self.config_file}")
             except Exception as e:
                 print(f"Error loading log settings: {e}")
         else:
             print(f"No log settings file found. Using default settings.")
 
-    async def _log(self, level, text):
-        """Общий метод логирования для всех уровней."""
+    def _enqueue(self, level, text, args, profile=None, site=None):
+        """
+        Ставит запись в очередь писателя. O(1), не создает задач и не трогает файлы.
+        Безопасно вызывать из любого потока, в том числе без запущенного цикла событий.
+        Аргументы %-шаблона подставляются сразу (как logging.QueueHandler.prepare): вызывающий может
+        изменить переданные объекты, а писатель не должен видеть их более позднее состояние.
+        """
+        if args and not callable(text):
+            text, args = self._render(text, args), ()
+        self._pending.append((level, text, args, time.time(), profile, site))
+        if self._writer_thread is None or self._stopping:
+            self._start_writer()
+        elif len(self._pending) >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _start_writer(self):
+        """Запускает поток писателя; после close() записи пишутся синхронно."""
+        with self._write_lock:
+            if self._stopping:
+                self._drain()
+                return
+            if self._writer_thread is not None:
+                return
+            self._writer_thread = threading.Thread(target=self._writer_loop, name="plogging-writer", daemon=True)
+            self._writer_thread.start()
+
+    def _writer_loop(self):
+        """
+        Единственный писатель: забирает записи пачками и сбрасывает их в файлы и консоль.
+        Работает в отдельном потоке, поэтому файловый ввод-вывод не блокирует цикл событий.
+        """
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception as e:
+                # Поток писателя не должен завершаться: иначе все последующие записи копятся в очереди
+                print(f"Error in plogging writer: {e}")
+
+    def _drain(self):
+        """Записывает все накопленные записи пачками по flush_batch_size."""
+        with self._write_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.flush_batch_size:
+                    batch.append(self._pending.popleft())
+                self._write_batch(batch)
+            if self._repeats or self._rate_limits:
+                expired = self._expire_suppressed(time.time())
+                if expired:
+                    self._write_records(expired)
+            for path, handle in list(self._handles.items()):
+                try:
+                    handle.flush()
+                except Exception as e:
+                    print(f"Error flushing log file {path}: {e}")
+
+    def _format_time(self, created):
+        """Возвращает время записи в формате HH:MM:SS, кешируя результат в пределах секунды."""
+        second = int(created)
+        if self._time_cache[0] != second:
+            self._time_cache = (second, time.strftime("%H:%M:%S", time.localtime(second)))
+        return self._time_cache[1]
+
+    def _write_batch(self, batch):
+        """Форматирует пачку записей, отбрасывает повторы и превышения лимитов и пишет остальное."""
         if self.recursion_guard:
-            print(f"Recursion prevented: {text}")
+            print(f"Recursion prevented: {len(batch)} records")
             return
         try:
-            current_date = self._get_current_date()
-            if current_date != self.last_log_date:
-                # Дата изменилась, архивируем текущие файлы и создаем новые
-                self.archive_logs()
-                for lvl in self.log_filepaths.keys():
-                    self.create_log_file(lvl)
-                self.last_log_date = current_date
-
-            # Логируем сообщение
-            time_now = datetime.datetime.now()
-            formatted_time = time_now.strftime("%H:%M:%S")
-            self.last_log_message = f"[{formatted_time}][{level.upper()}]: {text}"
-            if self._wb_translate[level] == True:
-                self.log_history.append(self.last_log_message)
+            self._write_records(self._filter_records(batch))
+        except Exception as e:
+            self.recursion_guard = True
+            print(f"Error in plogging: {e}")
+            self.recursion_guard = False
+
+    def _filter_records(self, batch):
+        """
+        Формирует текст записей и применяет подавление повторов и лимиты компонентов.
+        Возвращает список (level, text, created, profile), включая итоговые строки со счетчиками.
+        """
+        records = []
+        dedup = self.dedup_window > 0
+        for level, text, args, created, profile, site in batch:
+            text = self._render(text, args)
+            if dedup and site is not None:
+                key = (site, text)
+                state = self._repeats.get(key)
+                if state is not None:
+                    if created - state[0] < self.dedup_window:
+                        state[1] += 1
+                        state[2] = created
+                        continue
+                    if state[1]:
+                        records.append(self._repeat_summary(text, state))
+                self._repeats[key] = [created, 0, created, level, profile]
+            if self._rate_limits and level in ('debug', 'info') and not self._take_token(text, created, records):
+                continue
+            records.append((level, text, created, profile))
+        return records
+
+    @staticmethod
+    def _repeat_summary(text, state):
+        window_start, suppressed, last_created, level, profile = state
+        return (level, f"{text} (повторено еще {suppressed} раз за {last_created - window_start:.1f} сек)", last_created, profile)
+
+    def _take_token(self, text, created, records):
+        """Token bucket компонента записи. Возвращает False, если запись нужно отбросить."""
+        component, _ = split_component(text)
+        bucket = self._rate_limits.get(component)
+        if bucket is None:
+            return True
+        rate, burst, tokens, last, dropped = bucket
+        tokens = min(burst, tokens + (created - last) * rate)
+        bucket[3] = created
+        if tokens < 1:
+            bucket[2] = tokens
+            bucket[4] = dropped + 1
+            return False
+        bucket[2] = tokens - 1
+        if dropped:
+            records.append(self._rate_summary(component, bucket, created))
+        return True
+
+    @staticmethod
+    def _rate_summary(component, bucket, created):
+        dropped = bucket[4]
+        bucket[4] = 0
+        return ('warn', f"[{component}] Пропущено {dropped} сообщений (лимит {bucket[0]:g}/сек)", created, None)
+
+    def _expire_suppressed(self, now):
+        """Выпускает итоговые строки для истекших окон повторов и отброшенных по лимиту записей."""
+        records = []
+        for key, state in list(self._repeats.items()):
+            if now - state[0] >= self.dedup_window:
+                if state[1]:
+                    records.append(self._repeat_summary(key[1], state))
+                del self._repeats[key]
+        # set_rate_limit может менять словарь из другого потока - проходим по снимку
+        for component, bucket in list(self._rate_limits.items()):
+            if bucket[4] and min(bucket[1], bucket[2] + (now - bucket[3]) * bucket[0]) >= 1:
+                records.append(self._rate_summary(component, bucket, now))
+        return records
+
+    def set_rate_limit(self, component, rate, burst=None):
+        """
+        Ограничивает число debug/info записей компонента (тег [Component] в начале сообщения):
+        rate записей в секунду с запасом burst. rate=None снимает ограничение.
+        warn и error не ограничиваются.
+        """
+        if rate is None:
+            self._rate_limits.pop(component, None)
+            return
+        burst = burst if burst is not None else rate
+        self._rate_limits[component] = [float(rate), float(burst), float(burst), time.time(), 0]
+
+    def _write_records(self, records):
+        """Пишет готовые записи во все приемники одним вызовом write на каждый файл."""
+        if not records:
+            return
+        try:
+            self._maybe_rotate()
+
+            lines_by_path = {}
+            console_lines = []
+            history_updated = False
+            to_file = {level: self._sink_accepts('file', level) for level in LOG_LEVELS}
+            to_console = {level: self.console_output and self._sink_accepts('console', level) for level in LOG_LEVELS}
+            to_websocket = {level: self._wb_translate[level] == True and self._sink_accepts('websocket', level) for level in LOG_LEVELS}
+            to_stream = {level: self._sink_accepts('websocket', level) for level in LOG_LEVELS}
+            json_format = self.log_format == 'json'
+            subscriptions = self._subscriptions
+            stream = []
+            for level, text, created, profile in records:
+                message = f"[{self._format_time(created)}][{level.upper()}]: {text}"
+                self.last_log_message = message
+                seq = None  # записи вне истории (уровень отключен в set_websocket_settings) идут подписчикам без номера
+                if to_websocket[level]:
+                    seq = self.log_history.append(message)
+                    history_updated = True
+                if subscriptions and to_stream[level]:
+                    stream.append({'seq': seq, 'ts': created, 'level': level, 'profile': profile, 'msg': message})
+                if to_console[level]:
+                    console_lines.append(message)
+                log_file_path = self.log_filepaths[level]
+                if log_file_path and to_file[level]:
+                    line = self._format_json(level, text, created, profile) if json_format else message
+                    lines_by_path.setdefault(log_file_path, []).append(line)
+
+            for log_file_path, lines in lines_by_path.items():
+                data = ("\n".join(lines) + "\n").encode("utf-8")
+                self._get_handle(log_file_path).write(data)
+                self._file_sizes[log_file_path] = self._file_sizes.get(log_file_path, 0) + len(data)
+            if console_lines:
+                sys.stdout.write("\n".join(console_lines) + "\n")
+                sys.stdout.flush()
+            if stream:
+                for subscription in subscriptions:
+                    subscription._push(stream)
+            if history_updated:
+                # Один сигнал на пачку: подписчики забирают новые записи через get_history_since()
                 self.on_log_message.emit()
-                
-            print(self.last_log_message)
-            log_file_path = self.log_filepaths[level]
-            with open(log_file_path, "a", encoding="utf-8") as log_file:
-                log_file.write(f"{self.last_log_message}\n")
         except Exception as e:
             self.recursion_guard = True
             print(f"Error in plogging: {e}")
             self.recursion_guard = False
 
-    def info(self, text):
-        asyncio.create_task(self._log("info", text))
+    @staticmethod
+    def _format_json(level, text, created, profile):
+        """Формирует строку JSON lines; компонент берется из тега [Component] в начале сообщения."""
+        component, tagged_profile = split_component(text)
+        return json.dumps({
+            'ts': datetime.datetime.fromtimestamp(created).isoformat(timespec='milliseconds'),
+            'level': level,
+            'component': component,
+            'profile': profile or tagged_profile,
+            'msg': text,
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _render(text, args):
+        """Формирует текст записи: вызывает callable и подставляет аргументы в %-шаблон."""
+        try:
+            if callable(text):
+                text = text()
+            if args:
+                text = str(text) % args
+            return str(text)
+        except Exception as e:
+            return f"{text} {args!r} (formatting error: {e})"
+
+    def _get_handle(self, path):
+        """Возвращает открытый дескриптор файла журнала, открывая его при первом обращении."""
+        handle = self._handles.get(path)
+        if handle is None:
+            handle = open(path, "ab")
+            self._handles[path] = handle
+        return handle
+
+    def _close_handle(self, path):
+        handle = self._handles.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except Exception as e:
+                print(f"Error closing log file {path}: {e}")
+
+    def _close_handles(self):
+        for path in list(self._handles.keys()):
+            self._close_handle(path)
+
+    def flush(self):
+        """Синхронно записывает все накопленные записи на диск."""
+        self._drain()
+
+    def close(self):
+        """
+        Останавливает поток писателя, записывает оставшиеся записи и закрывает файлы журнала
+        (вызывается и при выходе). Записи после close() пишутся синхронно.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        writer = self._writer_thread
+        if writer is not None and writer is not threading.current_thread():
+            writer.join(timeout=5)
+        self._drain()
+        with self._write_lock:
+            self._close_handles()
+        if self._archive_executor is not None:
+            self._archive_executor.shutdown(wait=True)
+            self._archive_executor = None
+
+    @staticmethod
+    def _call_site():
+        """Место вызова метода уровня (код и строка) - ключ для подавления повторов."""
+        frame = sys._getframe(2)
+        return (frame.f_code, frame.f_lineno)
+
+    # Методы уровней принимают готовую строку, %-шаблон с аргументами или callable без аргументов.
+    # Запись создается, только если ее примет хотя бы один приемник; шаблон форматируется при вызове,
+    # callable - в потоке писателя:
+    #   plogging.debug("[WS] 📤 Отправка: %s", data)
+    #   plogging.debug(lambda: f"[WS] {expensive()}")
+    # profile - имя профиля аккаунта для структурированного формата (json).
+    def info(self, text, *args, profile=None):
+        if self._enabled_levels['info']:
+            self._enqueue("info", text, args, profile, self._call_site())
 
-    def error(self, text):
-        asyncio.create_task(self._log("error", text))
+    def error(self, text, *args, profile=None):
+        if self._enabled_levels['error']:
+            self._enqueue("error", text, args, profile, self._call_site())
 
-    def debug(self, text):
-        asyncio.create_task(self._log("debug", text))
+    def debug(self, text, *args, profile=None):
+        if self._enabled_levels['debug']:
+            self._enqueue("debug", text, args, profile, self._call_site())
+
+    def warn(self, text, *args, profile=None):
+        if self._enabled_levels['warn']:
+            self._enqueue("warn", text, args, profile, self._call_site())
+
+    def subscribe(self, maxsize: int = 1000) -> LogSubscription:
+        """
+        Создает подписку на живой поток записей, попадающих в историю для WebSocket.
+        Вызывается из цикла событий, в котором подписчик будет ждать записи.
+        """
+        subscription = LogSubscription(self, maxsize, asyncio.get_running_loop())
+        self._subscriptions = self._subscriptions + [subscription]
+        self._update_enabled_levels()
+        return subscription
 
-    def warn(self, text):
-        asyncio.create_task(self._log("warn", text))
+    def _unsubscribe(self, subscription):
+        self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+        self._update_enabled_levels()
+
+    def set_history_size(self, size: int):
+        """Задает максимальное число записей, хранимых в истории."""
+        self.history_size = size
+        self.log_history.resize(size)
+        self.save_log_settings()
 
     def get_history(self):
         return list(self.log_history) if self.log_history is not None else "Log history clear."
 
+    def get_history_since(self, seq: int = -1, limit: int = None):
+        """
+        Возвращает записи истории, добавленные после записи с номером seq.
+        
+        Номер больше последнего в истории (клиент помнит номера прошлого запуска, а после перезапуска
+        нумерация начинается с 0) считается новой подпиской: возвращается вся сохраненная история.
+
+        Returns:
+            Кортеж (entries, last_seq), где entries - список (seq, message),
+            а last_seq - номер, который нужно передать при следующем вызове.
+        """
+        if seq > self.log_history.last_seq:
+            seq = -1
+        entries = self.log_history.since(seq, limit)
+        last_seq = entries[-1][0] if entries else max(seq, self.log_history.first_seq - 1)
+        return entries, last_seq
+
     def get_last_log_message(self):
-        return str(self.log_history[-1])
+        return str(self.log_history.last())
@@ -0,0 +1,213 @@
+"""
+Быстрая проверка кнопок сопоставлением с шаблонами перед вызовом YOLO.
+
+Кнопки join_rain и rain_joined почти не меняются от рейна к рейну. TemplateMatcher собирает
+их эталонные вырезки из уверенных детекций YOLO и запоминает, где они были найдены. Следующая проверка
+сначала ищет шаблоны cv2.matchTemplate в окрестности последнего положения: если одна метка совпала
+уверенно и однозначно, результат возвращается без прохода сети. Во всех остальных случаях
+(шаблонов нет, совпадение слабое или подходят несколько меток) решение остается за YOLO.
+
+Часть быстрых ответов перепроверяется через YOLO; если доля подтвержденных падает ниже
+min_accuracy, быстрый путь для метки отключается. Счетчики и задержки - в stats().
+"""
+import statistics
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _iou(a, b) -> float:
+    """IoU двух рамок (x, y, width, height)."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _LabelState:
+    """Шаблоны, последнее положение и статистика одной метки."""
+
+    def __init__(self, max_templates: int, history: int):
+        self.templates: deque = deque(maxlen=max_templates)
+        self.locations: dict = {}  # область захвата -> экранные координаты последней рамки
+        self.enabled = True
+        self.matches = 0       # ответов быстрым путем (включая перепроверенные)
+        self.fallbacks = 0     # проверок, ушедших в YOLO
+        self.verified = 0      # быстрых ответов, перепроверенных через YOLO
+        self.agreed = 0        # из них подтвержденных YOLO
+        self.match_ms: deque = deque(maxlen=history)
+        self.yolo_ms: deque = deque(maxlen=history)
+
+
+class TemplateMatcher:
+    """
+    Шаблоны меток и быстрый путь проверки; используется только из потока инференса.
+
+    Args:
+        labels: метки, для которых собираются шаблоны
+        harvest_confidence: минимальная уверенность YOLO, с которой детекция становится шаблоном
+        accept_score: минимальный TM_CCOEFF_NORMED для ответа без YOLO
+        ambiguity_margin: насколько лучшая метка должна опережать следующую, чтобы совпадение считалось однозначным
+        search_margin: на сколько пикселей область поиска шире последнего положения кнопки
+        max_templates: сколько вариантов внешнего вида хранить для метки
+        verify_every: каждый какой быстрый ответ перепроверять через YOLO (0 - не перепроверять)
+        min_accuracy: доля подтвержденных ответов, ниже которой быстрый путь метки отключается
+        min_verified: после скольких перепроверок применяется min_accuracy
+    """
+
+    def __init__(self, labels=("join_rain", "rain_joined"), harvest_confidence: float = 0.9,
+                 accept_score: float = 0.9, ambiguity_margin: float = 0.1, search_margin: int = 40,
+                 max_templates: int = 3, verify_every: int = 10, min_accuracy: float = 0.9,
+                 min_verified: int = 5, history: int = 200):
+        self.labels = tuple(labels)
+        self.harvest_confidence = harvest_confidence
+        self.accept_score = accept_score
+        self.ambiguity_margin = ambiguity_margin
+        self.search_margin = search_margin
+        self.verify_every = verify_every
+        self.min_accuracy = min_accuracy
+        self.min_verified = min_verified
+        self._state = {label: _LabelState(max_templates, history) for label in self.labels}
+
+    def covers(self, labels) -> bool:
+        """
+        Можно ли ответить на запрос с этими метками быстрым путем: у каждой метки должны быть шаблоны,
+        иначе неоднозначность с еще не виденной меткой (например, rain_joined после клика) не проверить.
+        """
+        return bool(labels) and all(label in self._state and self._state[label].enabled
+                                    and self._state[label].templates for label in labels)
+
+    def harvest(self, frame: np.ndarray, detections, region: tuple[int, int, int, int] | None = None):
+        """
+        Запоминает положение (для области region) и, если внешний вид новый, вырезку
+        уверенных детекций отслеживаемых меток.
+        """
+        offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+        for label, state in self._state.items():
+            index = detections.best_index(label)
+            if index is None or detections.confidences[index] < self.harvest_confidence:
+                continue
+            x, y, width, height = (int(v) for v in detections.boxes[index])
+            state.locations[region] = (x, y, width, height)
+            left, top = x - offset_x, y - offset_y
+            if left < 0 or top < 0 or width < 4 or height < 4:
+                continue
+            crop = _gray(frame[top:top + height, left:left + width])
+            if crop.shape != (height, width):
+                continue  # рамка выходит за кадр
+            if any(template.shape == crop.shape and
+                   cv2.matchTemplate(crop, template, cv2.TM_CCOEFF_NORMED)[0, 0] >= self.accept_score
+                   for template in state.templates):
+                continue  # такой вид кнопки уже есть
+            state.templates.append(crop.copy())
+
+    def _score(self, gray: np.ndarray, state: _LabelState, region):
+        """Лучшее совпадение шаблонов метки в окрестности последнего положения: (score, рамка) или None."""
+        location = state.locations.get(region)
+        if location is None or not state.templates:
+            return None
+        x, y, width, height = location
+        offset = (region[0], region[1]) if region else (0, 0)
+        frame_h, frame_w = gray.shape
+        left = max(0, x - offset[0] - self.search_margin)
+        top = max(0, y - offset[1] - self.search_margin)
+        right = min(frame_w, x - offset[0] + width + self.search_margin)
+        bottom = min(frame_h, y - offset[1] + height + self.search_margin)
+        area = gray[top:bottom, left:right]
+        best = None
+        for template in state.templates:
+            t_h, t_w = template.shape
+            if area.shape[0] < t_h or area.shape[1] < t_w:
+                continue  # окно уменьшилось - шаблон не помещается
+            _, score, _, (match_x, match_y) = cv2.minMaxLoc(cv2.matchTemplate(area, template, cv2.TM_CCOEFF_NORMED))
+            if best is None or score > best[0]:
+                best = (float(score), (left + match_x + offset[0], top + match_y + offset[1], t_w, t_h))
+        return best
+
+    def match(self, frame: np.ndarray, labels, region: tuple[int, int, int, int] | None = None):
+        """
+        Ищет метки запроса шаблонами в кадре области region. Возвращает (метка, рамка в экранных координатах, score),
+        если одна метка совпала уверенно и однозначно, иначе None - нужен YOLO.
+        Однозначность проверяется по всем меткам запроса, поэтому если для какой-то из них нет шаблона
+        или положения в этой области, ответ остается за YOLO.
+        """
+        start = time.perf_counter()
+        gray = _gray(frame)
+        scored = []
+        for label in labels:
+            best = self._score(gray, self._state[label], region)
+            if best is None:
+                scored = []
+                break
+            scored.append((best[0], label, best[1]))
+        scored.sort(reverse=True)
+        hit = None
+        if scored and scored[0][0] >= self.accept_score:
+            runner_up = scored[1][0] if len(scored) > 1 else -1.0
+            if scored[0][0] - runner_up >= self.ambiguity_margin:
+                hit = (scored[0][1], scored[0][2], scored[0][0])
+        elapsed = (time.perf_counter() - start) * 1000
+        for label in labels:
+            state = self._state[label]
+            state.match_ms.append(elapsed)
+            if hit is None:
+                state.fallbacks += 1
+        if hit is not None:
+            self._state[hit[0]].matches += 1
+        return hit
+
+    def due_for_check(self, label: str) -> bool:
+        """Нужно ли перепроверить этот быстрый ответ через YOLO."""
+        return self.verify_every > 0 and self._state[label].matches % self.verify_every == 0
+
+    def record_check(self, label: str, box: tuple[int, int, int, int], detections) -> bool:
+        """
+        Сравнивает быстрый ответ с детекциями YOLO (та же метка, IoU >= 0.5) и обновляет точность.
+        Возвращает False, если быстрый путь метки был отключен из-за низкой точности.
+        """
+        state = self._state[label]
+        reference = detections.best_box(label)
+        state.verified += 1
+        if reference is not None and _iou(box, reference) >= 0.5:
+            state.agreed += 1
+        if state.verified >= self.min_verified and state.agreed / state.verified < self.min_accuracy:
+            state.enabled = False
+            return False
+        return True
+
+    def record_yolo(self, labels, elapsed_ms: float):
+        for label in labels:
+            if label in self._state:
+                self._state[label].yolo_ms.append(elapsed_ms)
+
+    def stats(self) -> dict:
+        """
+        Статистика по меткам: число быстрых ответов и переходов к YOLO, точность по перепроверкам
+        и медианные задержки шаблонного пути и YOLO в мс.
+        """
+        report = {}
+        for label, state in self._state.items():
+            # list(deque) копируется атомарно, поэтому статистику можно читать из цикла событий
+            match_ms, yolo_ms = list(state.match_ms), list(state.yolo_ms)
+            report[label] = {
+                "enabled": state.enabled,
+                "templates": len(state.templates),
+                "matches": state.matches,
+                "fallbacks": state.fallbacks,
+                "verified": state.verified,
+                "accuracy": state.agreed / state.verified if state.verified else None,
+                "match_ms_p50": statistics.median(match_ms) if match_ms else None,
+                "yolo_ms_p50": statistics.median(yolo_ms) if yolo_ms else None,
+            }
+        return report
+
+    def reset(self):
+        """Забывает шаблоны и положения (например, после смены темы или масштаба страницы)."""
+        for label, state in self._state.items():
+            self._state[label] = _LabelState(state.templates.maxlen, state.match_ms.maxlen)
@@ -1,93 +1,428 @@
-    
-            
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
 from ultralytics import YOLO
-import pyautogui
-import numpy as np
 import cv2
+import numpy as np
 from raincollector.utils.plogging import Plogging
+from raincollector.utils.capture import CaptureBackend, create_capture_backend
+from raincollector.utils.detections import Detections
+from raincollector.utils.inference import InferenceExecutor
+from raincollector.utils.model_export import resolve_model_path
+from raincollector.utils.templates import TemplateMatcher
+from raincollector.utils.frame_recorder import FrameRecorder
+from raincollector.utils.inference_pool import InferencePool
 
 class DetectionModel(YOLO):
-    def __init__(self, model_path: str, logger: Plogging):
-        super().__init__(model_path)
+    def __init__(self, model_path: str, logger: Plogging, capture: CaptureBackend | str = "auto",
+                 torch_threads: int | None = None, max_pending_inference: int = 4, backend: str = "pt",
+                 templates: TemplateMatcher | None = None, template_fast_path: bool = True,
+                 recorder: FrameRecorder | None = None):
+        # backend: 'pt', 'onnx', 'openvino' или 'openvino-int8' (см. raincollector.utils.model_export);
+        # экспортированный артефакт используется только после успешной проверки, иначе загружается .pt
+        resolved_path = resolve_model_path(model_path, backend, logger)
+        super().__init__(resolved_path, task="detect")
+        self.backend = backend if resolved_path != model_path else "pt"
+        self.weights_path = model_path
         self.plogging: Plogging = logger
         self.confidence_threshold = 0.7
-        
-    async def detect_objects(self, grayscale: bool = False) -> dict:
+        # Источник кадров: экземпляр CaptureBackend или имя ('auto', 'mss', 'pyautogui')
+        self.capture: CaptureBackend = create_capture_backend(capture) if isinstance(capture, str) else capture
+        # Захват и инференс выполняются в выделенном потоке, цикл событий только ждет результат
+        self.inference = InferenceExecutor(max_pending=max_pending_inference, torch_threads=torch_threads)
+        # Кэш детекций по отпечатку кадра: неизменившийся экран не прогоняется через модель повторно.
+        # Доступ только из потока инференса; cache_ttl = 0 отключает кэш
+        self.cache_ttl = 1.0
+        self.cache_size = 32
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache: OrderedDict = OrderedDict()
+        # Шаблоны join_rain / rain_joined из уверенных детекций: проверка кнопки сначала
+        # сопоставлением с шаблоном, YOLO - только при неоднозначном совпадении. None отключает быстрый путь
+        self.templates: TemplateMatcher | None = (templates or TemplateMatcher()) if template_fast_path else None
+        self._first_detect_logged = False
+        # Необязательная запись кадров с детекциями (без блокировки: при нагрузке кадры отбрасываются)
+        self.recorder: FrameRecorder | None = recorder
+        # Пул процессов инференса (start_pool); None - модель вызывается в потоке инференса этого процесса
+        self.pool: InferencePool | None = None
+
+    def warmup(self, height: int = 720, width: int = 1280, runs: int = 2) -> list[float]:
+        """
+        Прогревочный инференс на пустом кадре размером с типичное окно: первый вызов создает
+        предиктор и выделяет буферы, чтобы это не происходило во время рейна.
+        Выполняется в потоке инференса; возвращает задержки прогонов в мс (первый - холодный).
+        """
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        latencies = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            self._predict(frame, (None, (), None))
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    @staticmethod
+    def _fingerprint(frame: np.ndarray) -> bytes:
+        """
+        Дешевый отпечаток кадра: уменьшенная копия 64x36 с огрублением яркости до 16 уровней.
+        Шум сжатия и сглаживания не меняет отпечаток, появление или исчезновение элемента интерфейса - меняет.
+        """
+        thumb = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA) >> 4
+        return hashlib.blake2b(thumb.tobytes(), digest_size=16).digest()
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.cache_ttl:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return entry[1]
+        self.cache_misses += 1
+        return None
+
+    def _cache_put(self, key, detections: Detections):
+        self._cache[key] = (time.monotonic(), detections)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def cache_stats(self) -> dict:
+        """Счетчики кэша детекций: попадания, промахи и доля сэкономленных вызовов модели."""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_rate": self.cache_hits / total if total else 0.0,
+        }
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def template_stats(self) -> dict:
+        """Статистика быстрого пути по шаблонам для каждой метки (см. TemplateMatcher.stats)."""
+        return self.templates.stats() if self.templates is not None else {}
+
+    @staticmethod
+    def _resolve_region(region) -> tuple[int, int, int, int] | None:
+        """
+        Приводит область захвата к кортежу (left, top, width, height).
+
+        Args:
+            region: None (весь экран), кортеж (left, top, width, height)
+                    или окно с методом get_region() (pygetWindow)
+        """
+        if region is None:
+            return None
+        if hasattr(region, "get_region"):
+            region = region.get_region()
+            if region is None:
+                return None
+        left, top, width, height = (int(v) for v in region)
+        return (left, top, width, height)
+
+    async def detect_objects(self, grayscale: bool = False, region=None, labels=None,
+                             thresholds: dict | None = None, imgsz: int | None = None,
+                             profile: str | None = None) -> Detections:
         """
         Захватывает скриншот окна (с помощью метода capture_screenshot),
-        пропускает изображение через модель YOLOv8 (ultralytics) и возвращает словарь с детекциями.
-        
-        Формат словаря:
-        { 'название_объекта': [(x, y, width, height), ...], ... }
-        
-        Если детекций нет, возвращается пустой словарь.
+        пропускает изображение через модель YOLOv8 (ultralytics) и возвращает детекции (Detections).
+
+        Если передан region (окно pygetWindow или кортеж (left, top, width, height)),
+        захват и инференс выполняются только для этой области, а координаты
+        детекций переводятся обратно в экранные.
+
+        Захват и инференс выполняются в потоке инференса (self.inference),
+        поэтому цикл событий не блокируется.
+
+        Args:
+            labels: названия нужных объектов; модель ищет только эти классы (None - все классы)
+            thresholds: пороги уверенности по названиям, например {'join_rain': 0.6};
+                        для остальных используется confidence_threshold
+            imgsz: размер входа модели (по умолчанию - размер, с которым обучена модель);
+                   для небольших областей можно уменьшить, например до 320
+            profile: профиль аккаунта - папка кадра в recorder (если запись включена)
+
+        Detections хранит метки, рамки (x, y, width, height), уверенности и центры в массивах;
+        detections.center('join_rain') - центр самой уверенной рамки метки.
+        Прежний словарь { 'название_объекта': [(x, y, width, height), ...], ... } - detections.as_dict().
+
+        Если детекций нет (или произошла ошибка), возвращается пустой Detections.
         """
         try:
-            # Захватываем скриншот через существующий метод
-            frame = await self.capture_screenshot(grayscale)
-
-            # Если требуется, преобразуем изображение в формат BGR для OpenCV (ultralytics YOLO ожидает RGB, как правило)
-            # Но обычно YOLO из ultralytics принимает NumPy-массивы в формате BGR или RGB, в зависимости от модели.
-            # Здесь предположим, что frame в RGB формате, как возвращает pyautogui.screenshot()
-
-            # Вызываем модель напрямую (YOLOv8 возвращает список результатов)
-            results = self(frame)  # вызов модели
-            # Инициализируем словарь для результатов
-            detection_dict = {}
-
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    confidence = float(box.conf[0])
-                    class_id = int(box.cls[0])
-
-                    if confidence > self.confidence_threshold:
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        x = int(x1)
-                        y = int(y1)
-                        width = int(x2 - x1)
-                        height = int(y2 - y1)
-                        
-                        label = self.names[class_id] if hasattr(self, 'names') else str(class_id)
-                        coords = (x, y, width, height)
-
-                        if label not in detection_dict:
-                            detection_dict[label] = coords  # просто кортеж
-                        else:
-                            # если уже есть кортеж — преобразуем в список
-                            if isinstance(detection_dict[label], tuple):
-                                detection_dict[label] = [detection_dict[label], coords]
-                            else:
-                                detection_dict[label].append(coords)
-            
-            return detection_dict
+            # Область окна вычисляем в цикле событий, дальше работает поток инференса
+            region = self._resolve_region(region)
+            query = self._make_query(labels, thresholds, imgsz)
+            if self._first_detect_logged:
+                return await self._run_detect(grayscale, region, query, profile)
+            start = time.perf_counter()
+            detections = await self._run_detect(grayscale, region, query, profile)
+            self._first_detect_logged = True
+            self.plogging.info("[DetectionModel] Первая детекция: %.1f мс.", (time.perf_counter() - start) * 1000)
+            return detections
 
         except Exception as e:
             # Логируем ошибку, если что-то пошло не так
             self.plogging.error(f"Ошибка при детекции объектов: {e}")
-            return {}
-        
-    async def find_target(self, target_name: str) -> tuple[int, int] | None:
-        detections = await self.detect_objects()
-        if target_name in detections:
-            coords = detections[target_name]
-            # Если несколько координат, берем первую
-            if isinstance(coords, list):
-                coords = coords[0]
-            x, y, width, height = coords
-            center_x = x + width // 2
-            center_y = y + height // 2
-            return (center_x, center_y)
-        return None
-        
-    async def capture_screenshot(self, grayscale: bool = False):
-        image = pyautogui.screenshot()  # Скриншот всего монитора
-        frame = np.array(image)
+            return Detections.empty(self.names)
+
+    async def _run_detect(self, grayscale: bool, region, query: tuple, profile: str | None) -> Detections:
+        if self.pool is not None:
+            return await self._detect_pooled(grayscale, region, query, profile)
+        return await self.inference.run(self._detect_sync, grayscale, region, query, profile)
+
+    def _make_query(self, labels, thresholds: dict | None, imgsz: int | None) -> tuple:
+        """
+        Приводит параметры запроса к хешируемому кортежу (классы, пороги, imgsz),
+        который передается в поток инференса и входит в ключ кэша.
+        """
+        classes = None
+        if labels is not None:
+            label_ids = {name: class_id for class_id, name in self.names.items()}
+            unknown = [label for label in labels if label not in label_ids]
+            if unknown:
+                raise ValueError(f"Неизвестные метки: {unknown}")
+            classes = tuple(sorted(label_ids[label] for label in labels))
+        thresholds = tuple(sorted(thresholds.items())) if thresholds else ()
+        return (classes, thresholds, imgsz)
+
+    def _predict_kwargs(self, query: tuple) -> dict:
+        """Аргументы predict для запроса: ограничение классов, порог NMS и размер входа."""
+        classes, thresholds, imgsz = query
+        # Порог для NMS - минимальный из запрошенных, точная фильтрация по меткам в _collect_detections
+        kwargs = {"conf": min([self.confidence_threshold, *(value for _, value in thresholds)]), "verbose": False}
+        if classes is not None:
+            kwargs["classes"] = list(classes)
+        if imgsz:
+            kwargs["imgsz"] = imgsz
+        return kwargs
+
+    def _predict(self, source, query: tuple):
+        """Вызов модели с ограничением классов и размером входа из запроса."""
+        return self.predict(source, **self._predict_kwargs(query))
+
+    def _lookup(self, frame: np.ndarray, grayscale: bool, region, query: tuple, profile: str | None):
+        """
+        Кэш и быстрый путь по шаблонам для захваченного кадра; выполняется в потоке инференса.
+        Возвращает (детекции или None, если нужна модель; ключ кэша; метки запроса; совпадение шаблона).
+        """
+        offset = (region[0], region[1]) if region else (0, 0)
+
+        # Тот же экран в той же области в пределах cache_ttl - возвращаем прошлые детекции
+        key = (region, grayscale, query, self._fingerprint(frame)) if self.cache_ttl > 0 else None
+        if key is not None:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached, key, None, None
+
+        # Быстрый путь: запрошенные метки ищутся шаблонами в окрестности прошлого положения
+        labels = [self.names[class_id] for class_id in query[0]] if query[0] is not None else None
+        hit = None
+        if self.templates is not None and self.templates.covers(labels):
+            hit = self.templates.match(frame, labels, region)
+            if hit is not None and not self.templates.due_for_check(hit[0]):
+                detections = Detections.from_boxes(self.names, [hit])
+                if key is not None:
+                    self._cache_put(key, detections)
+                if self.recorder is not None:
+                    self.recorder.submit(frame, detections, offset, profile, tag="template")
+                return detections, key, labels, hit
+        return None, key, labels, hit
+
+    def _finish(self, frame: np.ndarray, detections: Detections, region, key, labels, hit,
+                profile: str | None, model_ms: float):
+        """Учет результата модели: проверка и сбор шаблонов, кэш, запись кадра; выполняется в потоке инференса."""
+        if self.templates is not None:
+            if labels:
+                self.templates.record_yolo(labels, model_ms)
+            if hit is not None and not self.templates.record_check(hit[0], hit[1], detections):
+                self.plogging.warn(f"[DetectionModel] Шаблоны {hit[0]} расходятся с YOLO, быстрый путь для метки отключен.")
+            self.templates.harvest(frame, detections, region)
+
+        if key is not None:
+            self._cache_put(key, detections)
+        if self.recorder is not None:
+            self.recorder.submit(frame, detections, (region[0], region[1]) if region else (0, 0), profile)
+
+    def _detect_sync(self, grayscale: bool, region: tuple[int, int, int, int] | None, query: tuple,
+                     profile: str | None = None) -> Detections:
+        """Захват и инференс; выполняется в потоке инференса."""
+        offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+
+        frame = self._capture(grayscale, region)
+
+        # frame - BGR-представление буфера источника кадров (ultralytics ожидает BGR для NumPy).
+        # Буфер перезаписывается следующим захватом, поэтому инференс выполняется сразу в том же потоке.
+        detections, key, labels, hit = self._lookup(frame, grayscale, region, query, profile)
+        if detections is not None:
+            return detections
+
+        # Вызываем модель (YOLOv8 возвращает список результатов, для одного кадра - один)
+        start = time.perf_counter()
+        result = self._predict(frame, query)[0]
+        detections = self._collect_detections(result, offset_x, offset_y, dict(query[1]))
+        self._finish(frame, detections, region, key, labels, hit, profile, (time.perf_counter() - start) * 1000)
+        return detections
+
+    async def start_pool(self, workers: int, torch_threads: int = 1, **kwargs) -> InferencePool:
+        """
+        Запускает пул процессов инференса (InferencePool) с копией модели в каждом процессе.
+        После запуска detect_objects и detect_batch выполняют вызов модели в свободном процессе пула,
+        захват, кэш и шаблоны остаются в потоке инференса.
+        """
+        pool = InferencePool(self.weights_path, workers, backend=self.backend, torch_threads=torch_threads,
+                             logger=self.plogging, **kwargs)
+        try:
+            await pool.start()
+        except Exception:
+            await asyncio.to_thread(pool.close)
+            raise
+        self.pool = pool
+        return pool
+
+    async def stop_pool(self):
+        """Останавливает пул; ожидание процессов выполняется вне цикла событий."""
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            await asyncio.to_thread(pool.close)
+
+    async def _detect_pooled(self, grayscale: bool, region, query: tuple, profile: str | None,
+                             tag: str = "") -> Detections:
+        """detect_objects через пул процессов: кадр передается процессу через слот разделяемой памяти."""
+        pool = self.pool
+        slot = await pool.acquire()
+        try:
+            prepared = await self.inference.run(self._prepare_pooled, pool, slot, grayscale, region, query, profile)
+            if isinstance(prepared, Detections):
+                return prepared
+            shape, key, labels, hit = prepared
+            start = time.perf_counter()
+            data = await pool.predict(slot, shape, self._predict_kwargs(query))
+            model_ms = (time.perf_counter() - start) * 1000
+            return await self.inference.run(self._finish_pooled, pool, slot, data, shape, region, query,
+                                            key, labels, hit, profile, model_ms)
+        finally:
+            pool.release(slot)
+
+    def _prepare_pooled(self, pool: InferencePool, slot: int, grayscale: bool, region, query: tuple,
+                        profile: str | None):
+        """Захват, кэш и шаблоны; при промахе копирует кадр в слот пула. Выполняется в потоке инференса."""
+        frame = self._capture(grayscale, region)
+        detections, key, labels, hit = self._lookup(frame, grayscale, region, query, profile)
+        if detections is not None:
+            return detections
+        if not pool.fits(frame):
+            # Кадр больше слота - вызываем модель этого процесса
+            start = time.perf_counter()
+            offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+            detections = self._collect_detections(self._predict(frame, query)[0], offset_x, offset_y, dict(query[1]))
+            self._finish(frame, detections, region, key, labels, hit, profile, (time.perf_counter() - start) * 1000)
+            return detections
+        np.copyto(pool.frame_view(slot, frame.shape), frame)
+        return frame.shape, key, labels, hit
+
+    def _finish_pooled(self, pool: InferencePool, slot: int, data: np.ndarray, shape: tuple, region, query: tuple,
+                       key, labels, hit, profile: str | None, model_ms: float) -> Detections:
+        offset_x, offset_y = (region[0], region[1]) if region else (0, 0)
+        detections = Detections.from_array(data, self.names, offset_x, offset_y,
+                                           threshold=self.confidence_threshold, thresholds=dict(query[1]))
+        # Кадр еще лежит в слоте - он нужен для шаблонов и записи
+        self._finish(pool.frame_view(slot, shape), detections, region, key, labels, hit, profile, model_ms)
+        return detections
+
+    def _collect_detections(self, result, offset_x: int = 0, offset_y: int = 0,
+                            thresholds: dict | None = None) -> Detections:
+        """Переводит результат YOLO для одного кадра в Detections с экранными координатами."""
+        return Detections.from_result(result, self.names, offset_x, offset_y,
+                                      threshold=self.confidence_threshold, thresholds=thresholds)
+
+    async def detect_batch(self, sources: list, grayscale: bool = False, labels=None,
+                           thresholds: dict | None = None, imgsz: int | None = None,
+                           profiles: list | None = None) -> list[Detections]:
+        """
+        Детекция сразу для нескольких окон за один батчевый проход модели
+        (с запущенным пулом процессов - параллельно в процессах пула).
+
+        Args:
+            sources: список областей (окно pygetWindow, кортеж (left, top, width, height) или None - весь экран)
+                     и/или готовых кадров BGR (np.ndarray)
+            grayscale: захватывать области в оттенках серого
+            labels, thresholds, imgsz: как в detect_objects
+            profiles: профили аккаунтов по источникам - для recorder (если запись включена)
+
+        Returns:
+            Список Detections в том же порядке, что и sources (как у detect_objects).
+            Координаты для областей - экранные, для готовых кадров - в системе координат кадра.
+        """
+        if not sources:
+            return []
+        try:
+            items = [source if isinstance(source, np.ndarray) else self._resolve_region(source) for source in sources]
+            query = self._make_query(labels, thresholds, imgsz)
+            if self.pool is not None and not any(isinstance(item, np.ndarray) for item in items):
+                # С пулом окна распределяются по процессам и обрабатываются параллельно, а не одним батчем
+                return list(await asyncio.gather(*(
+                    self._detect_pooled(grayscale, item, query, profiles[index] if profiles else None)
+                    for index, item in enumerate(items))))
+            return await self.inference.run(self._detect_batch_sync, items, grayscale, query, profiles)
+
+        except Exception as e:
+            self.plogging.error(f"Ошибка при батчевой детекции объектов: {e}")
+            return [Detections.empty(self.names) for _ in sources]
+
+    def _detect_batch_sync(self, items: list, grayscale: bool, query: tuple,
+                           profiles: list | None = None) -> list[Detections]:
+        """Захват всех областей и один вызов модели для всего батча; выполняется в потоке инференса."""
+        outputs = [None] * len(items)
+        frames, offsets, keys, positions = [], [], [], []
+        for index, item in enumerate(items):
+            if isinstance(item, np.ndarray):
+                frame, offset, key = item, (0, 0), None
+            else:
+                frame = self._capture(grayscale, item)
+                offset = (item[0], item[1]) if item else (0, 0)
+                key = (item, grayscale, query, self._fingerprint(frame)) if self.cache_ttl > 0 else None
+                if key is not None:
+                    cached = self._cache_get(key)
+                    if cached is not None:
+                        outputs[index] = cached
+                        continue
+                # Буфер источника перезаписывается следующим захватом, поэтому кадры батча копируются
+                frame = frame.copy()
+            frames.append(frame)
+            offsets.append(offset)
+            keys.append(key)
+            positions.append(index)
+
+        if frames:
+            results = self._predict(frames, query)  # один проход модели для всех кадров, которых нет в кэше
+            thresholds = dict(query[1])
+            for result, frame, (offset_x, offset_y), key, index in zip(results, frames, offsets, keys, positions):
+                detections = self._collect_detections(result, offset_x, offset_y, thresholds)
+                if self.templates is not None and not isinstance(items[index], np.ndarray):
+                    self.templates.harvest(frame, detections, items[index])
+                if key is not None:
+                    self._cache_put(key, detections)
+                if self.recorder is not None:
+                    self.recorder.submit(frame, detections, (offset_x, offset_y),
+                                         profiles[index] if profiles else None, tag="batch")
+                outputs[index] = detections
+        return outputs
+
+    async def find_target(self, target_name: str, region=None, threshold: float | None = None,
+                          imgsz: int | None = None) -> tuple[int, int] | None:
+        thresholds = {target_name: threshold} if threshold is not None else None
+        detections = await self.detect_objects(region=region, labels=(target_name,), thresholds=thresholds, imgsz=imgsz)
+        return detections.center(target_name)
+
+    async def capture_screenshot(self, grayscale: bool = False, region: tuple[int, int, int, int] | None = None):
+        """Возвращает собственную копию кадра области (left, top, width, height) или всего монитора в BGR."""
+        frame = await self.inference.run(self._capture, grayscale, self._resolve_region(region))
+        return frame.copy() if frame.base is not None else frame
 
-        # Преобразуем RGB в BGR (PyAutoGUI возвращает RGB, OpenCV работает с BGR)
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    def _capture(self, grayscale: bool = False, region: tuple[int, int, int, int] | None = None):
+        # Кадр в BGR без промежуточных копий; выполняется в потоке инференса
+        frame = self.capture.grab(region)
 
         if grayscale:
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)  # Преобразуем в оттенки серого, если нужно
 
-        return frame
\ No newline at end of file
+        return frame
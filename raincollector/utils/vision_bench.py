@@ -0,0 +1,269 @@
+"""
+Бенчмарк DetectionModel на записанных кадрах с известной разметкой.
+
+Корпус - папка с изображениями (как для ReplayCapture). Разметка - файлы YOLO-формата
+(<класс> <cx> <cy> <w> <h>, нормированные координаты) с тем же именем, что и кадр: рядом с ним
+или в соседней папке labels/. Кадры без файла разметки в оценке совпадения не участвуют.
+
+Измеряется по каждому кадру:
+- capture        - получение кадра из источника (ReplayCapture; с --live-capture - захват экрана)
+- preprocess, inference, postprocess - этапы ultralytics (result.speed)
+- collect        - перевод результата в Detections
+- detect_objects - полный вызов detect_objects через поток инференса
+
+Отчет (p50/p95/p99 по этапам, кадры в секунду, пиковая память, совпадение с разметкой) пишется в JSON,
+чтобы сравнивать бэкенды, размеры входа и пост-обработку между запусками (--baseline печатает разницу).
+
+Использование:
+  python -m raincollector.utils.vision_bench --frames corpus/ --out bench.json
+  python -m raincollector.utils.vision_bench --frames corpus/ --backend onnx --imgsz 480 --baseline bench.json --out bench_onnx.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import cv2
+from raincollector.utils.capture import ReplayCapture, create_capture_backend
+from raincollector.utils.model_export import box_iou, detection_agreement
+
+STAGES = ("capture", "preprocess", "inference", "postprocess", "collect", "detect_objects")
+
+
+def _label_path(image_path: str) -> str | None:
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    directory = os.path.dirname(image_path)
+    for candidate in (os.path.join(directory, stem + ".txt"),
+                      os.path.join(os.path.dirname(directory), "labels", stem + ".txt")):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def load_ground_truth(image_path: str, shape: tuple) -> list | None:
+    """Разметка кадра [(класс, [x1, y1, x2, y2]), ...] в пикселях или None, если файла нет."""
+    path = _label_path(image_path)
+    if path is None:
+        return None
+    height, width = shape[:2]
+    truth = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, cx, cy, w, h = int(parts[0]), *(float(v) for v in parts[1:5])
+            truth.append((cls, [(cx - w / 2) * width, (cy - h / 2) * height,
+                                (cx + w / 2) * width, (cy + h / 2) * height]))
+    return truth
+
+
+def _summary(values: list) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+            "mean": round(float(np.mean(values)), 3), "count": len(values)}
+
+
+class _PeakMemory:
+    """Пиковая память процесса в МБ: psutil (peak_wset на Windows, иначе максимум RSS по замерам) или resource."""
+
+    def __init__(self):
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+        self.peak = 0.0
+
+    def sample(self):
+        if self._process is not None:
+            info = self._process.memory_info()
+            self.peak = max(self.peak, getattr(info, "peak_wset", info.rss) / 2**20)
+
+    def result(self) -> float | None:
+        self.sample()
+        if self.peak:
+            return round(self.peak, 1)
+        try:
+            import resource
+        except ImportError:
+            return None
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _precision_recall(pairs: list, iou_threshold: float) -> tuple[float, float]:
+    """Точность и полнота по всем размеченным кадрам: пары (разметка, детекции)."""
+    true_positive = predicted = expected = 0
+    for truth, found in pairs:
+        predicted += len(found)
+        expected += len(truth)
+        unmatched = list(found)
+        for cls, box in truth:
+            match = next((item for item in unmatched if item[0] == cls and box_iou(box, item[1]) >= iou_threshold), None)
+            if match is not None:
+                unmatched.remove(match)
+                true_positive += 1
+    precision = true_positive / predicted if predicted else 1.0
+    recall = true_positive / expected if expected else 1.0
+    return precision, recall
+
+
+def run_benchmark(model, frames: str | ReplayCapture, imgsz: int | None = None, labels=None, repeat: int = 1,
+                  iou_threshold: float = 0.5, live_capture: str | None = None) -> dict:
+    """
+    Прогоняет корпус через этапы DetectionModel и возвращает отчет (см. описание модуля).
+    frames - папка с кадрами или уже загруженный ReplayCapture; корпус загружается один раз
+    и используется во всех замерах, чтобы копии кадров не завышали пиковую память.
+    """
+    replay = frames if isinstance(frames, ReplayCapture) else ReplayCapture(frames)
+    replay.loop, replay.advance, replay.index = False, False, 0
+    query = model._make_query(labels, None, imgsz)
+    live = create_capture_backend(live_capture) if live_capture else None
+    memory = _PeakMemory()
+    timings = {stage: [] for stage in STAGES}
+    pairs, agreements = [], []
+
+    model.inference.submit(model.warmup).result()
+    memory.sample()
+
+    # Поэтапные замеры в потоке инференса - там же, где их выполняет detect_objects
+    def _stages(index: int):
+        replay.index = index
+        start = time.perf_counter()
+        frame = replay.grab()
+        if live is not None:
+            start = time.perf_counter()
+            live.grab()
+        timings["capture"].append((time.perf_counter() - start) * 1000)
+        result = model._predict(frame, query)[0]
+        for stage in ("preprocess", "inference", "postprocess"):
+            timings[stage].append(result.speed.get(stage, 0.0))
+        start = time.perf_counter()
+        detections = model._collect_detections(result, thresholds=dict(query[1]))
+        timings["collect"].append((time.perf_counter() - start) * 1000)
+        return frame.shape, detections
+
+    for _ in range(repeat):
+        for index in range(len(replay)):
+            shape, detections = model.inference.submit(_stages, index).result()
+            memory.sample()
+            truth = load_ground_truth(replay.paths[index], shape) if replay.paths[index] else None
+            if truth is None:
+                continue
+            found = [(int(cls), [float(x), float(y), float(x + w), float(y + h)])
+                     for cls, (x, y, w, h) in zip(detections.label_ids, detections.boxes)]
+            if labels is not None:
+                wanted = {class_id for class_id, name in model.names.items() if name in labels}
+                truth = [item for item in truth if item[0] in wanted]
+            pairs.append((truth, found))
+            agreements.append(detection_agreement(truth, found, iou_threshold))
+
+    # Полный путь detect_objects с тем же корпусом в качестве источника кадров; кэш кадров отключен,
+    # чтобы каждый кадр проходил через модель
+    async def _end_to_end() -> float:
+        previous = (model.capture, model.cache_ttl)
+        replay.loop, replay.advance, replay.index = True, True, -1
+        model.capture, model.cache_ttl = replay, 0
+        try:
+            started = time.perf_counter()
+            for _ in range(repeat * len(replay)):
+                start = time.perf_counter()
+                await model.detect_objects(labels=labels, imgsz=imgsz)
+                timings["detect_objects"].append((time.perf_counter() - start) * 1000)
+                memory.sample()
+            return time.perf_counter() - started
+        finally:
+            model.capture, model.cache_ttl = previous
+
+    elapsed = asyncio.run(_end_to_end())
+    precision, recall = _precision_recall(pairs, iou_threshold)
+
+    return {
+        "frames": len(replay),
+        "repeat": repeat,
+        "backend": model.backend,
+        "imgsz": imgsz,
+        "labels": list(labels) if labels is not None else None,
+        "stages_ms": {stage: _summary(values) for stage, values in timings.items()},
+        "fps": round(len(timings["detect_objects"]) / elapsed, 2) if elapsed else None,
+        "peak_memory_mb": memory.result(),
+        "accuracy": {
+            "labelled_frames": len(pairs),
+            "agreement": round(float(np.mean(agreements)), 4) if agreements else None,
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "iou_threshold": iou_threshold,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "cpu_count": os.cpu_count(),
+            "live_capture": live_capture,
+        },
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """Строки с разницей p50 по этапам, FPS и совпадения относительно прошлого отчета."""
+    lines = []
+    for stage in STAGES:
+        new = report["stages_ms"].get(stage, {}).get("p50")
+        old = baseline.get("stages_ms", {}).get(stage, {}).get("p50")
+        if new is not None and old:
+            lines.append(f"{stage:>15}: p50 {old:.2f} -> {new:.2f} ms ({(new - old) / old * 100:+.1f}%)")
+    for key, path in (("fps", ("fps",)), ("agreement", ("accuracy", "agreement"))):
+        new, old = report, baseline
+        for part in path:
+            new, old = (new or {}).get(part), (old or {}).get(part)
+        if new is not None and old is not None:
+            lines.append(f"{key:>15}: {old} -> {new}")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк DetectionModel на записанных кадрах")
+    parser.add_argument("--frames", required=True, help="папка с кадрами (разметка YOLO .txt рядом или в labels/)")
+    parser.add_argument("--model", default="best.pt", help="исходная модель .pt")
+    parser.add_argument("--backend", default="pt", help="pt, onnx, openvino или openvino-int8")
+    parser.add_argument("--imgsz", type=int, help="размер входа модели (по умолчанию - как при обучении)")
+    parser.add_argument("--labels", nargs="+", help="искать только эти метки")
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз прогнать корпус")
+    parser.add_argument("--iou", type=float, default=0.5, help="порог IoU для совпадения с разметкой")
+    parser.add_argument("--torch-threads", type=int, help="число потоков PyTorch")
+    parser.add_argument("--no-templates", action="store_true", help="отключить быстрый путь по шаблонам")
+    parser.add_argument("--live-capture", help="замерять этап capture захватом экрана этим источником (mss, pyautogui)")
+    parser.add_argument("--baseline", help="прошлый отчет JSON для сравнения")
+    parser.add_argument("--out", default="vision_bench.json", help="файл отчета")
+    args = parser.parse_args(argv)
+
+    from raincollector.utils.plogging import Plogging
+    from raincollector.utils.vision import DetectionModel
+    corpus = ReplayCapture(args.frames)
+    model = DetectionModel(args.model, Plogging(), capture=corpus, backend=args.backend,
+                           torch_threads=args.torch_threads, template_fast_path=not args.no_templates)
+    report = run_benchmark(model, corpus, imgsz=args.imgsz, labels=args.labels, repeat=args.repeat,
+                           iou_threshold=args.iou, live_capture=args.live_capture)
+    report["model"] = args.model
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)))
+    model.inference.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@
 - Отправка команд клиенту (расширению)
 - Управление вкладками браузера
 - Список подключенных профилей
+- Живой поток логов для дашбордов (SUBSCRIBE_LOGS / UNSUBSCRIBE_LOGS)
 
 Зависимости:
   pip install websockets
@@ -21,6 +22,8 @@ from raincollector.models.websocket_client import Websocket_client
 
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 42332
+LOG_STREAM_QUEUE_SIZE = 1000  # записей в очереди одного подписчика на логи
+LOG_STREAM_BATCH_SIZE = 200  # записей в одном сообщении LOG_RECORDS
 
 # Инициализация логгера
 logger = Plogging()
@@ -43,6 +46,8 @@ class WebSocketServer:
         self.on_disconnect = None
         self.on_client_init = None  # Вызывается после получения INIT от клиента
         self.on_tabs_list = None  # Вызывается при получении списка вкладок
+        # Подписчики на поток логов: client_id -> (LogSubscription, задача отправки)
+        self._log_streams: Dict[str, tuple] = {}
     
     async def _handler(self, ws):
         """Обработка подключения клиента"""
@@ -66,13 +71,13 @@ class WebSocketServer:
 
             self.logger.debug(f"[WS] Начало цикла получения сообщений для {client_id}")
             async for message in ws:
-                self.logger.debug(f"[WS] 📨 Получено сообщение от {client.profile_name or client_id}, длина: {len(message) if isinstance(message, str) else len(message)} bytes")
+                self.logger.debug("[WS] 📨 Получено сообщение от %s, длина: %d bytes", client.profile_name or client_id, len(message))
                 
                 # Обработка входящих сообщений
                 try:
                     if isinstance(message, str):
                         data = json.loads(message)
-                        self.logger.info(f"[WS] 📥 Получено от {client.profile_name or client_id}: {data}")
+                        self.logger.info("[WS] 📥 Получено от %s: %s", client.profile_name or client_id, data)
                         
                         # Обработка INIT сообщения от расширения
                         if data.get("type") == "INIT":
@@ -99,11 +104,11 @@ class WebSocketServer:
                         
                         # Обработка PING/PONG keepalive
                         elif data.get("type") == "PING":
-                            self.logger.debug(f"[WS] 🏓 PING от {client.profile_name or client_id}, отправляем PONG")
+                            self.logger.debug("[WS] 🏓 PING от %s, отправляем PONG", client.profile_name or client_id)
                             await client.send({"type": "PONG"})
                         
                         elif data.get("type") == "PONG":
-                            self.logger.debug(f"[WS] 🏓 PONG от {client.profile_name or client_id}")
+                            self.logger.debug("[WS] 🏓 PONG от %s", client.profile_name or client_id)
                         
                         # Обработка ответов от расширения
                         elif data.get("type") == "TAB_OPENED":
@@ -114,9 +119,10 @@ class WebSocketServer:
                         
                         elif data.get("type") == "TABS_LIST":
                             tabs = data.get("tabs", [])
-                            self.logger.info(f"[WS] 📋 Получен список вкладок ({len(tabs)} шт):")
-                            for tab in tabs:
-                                self.logger.info(f"[WS]   - ID={tab['id']}: {tab['title'][:50]} ({tab['url'][:50]})")
+                            self.logger.info("[WS] 📋 Получен список вкладок (%d шт):", len(tabs))
+                            if self.logger.is_enabled_for("info"):
+                                for tab in tabs:
+                                    self.logger.info("[WS]   - ID=%s: %s (%s)", tab['id'], tab['title'][:50], tab['url'][:50])
                             
                             # Вызываем callback для обновления информации о вкладках
                             if self.on_tabs_list and client.profile_name:
@@ -136,14 +142,20 @@ class WebSocketServer:
                             tab_id = data.get("tabId")
                             self.logger.info(f"[WS] ✅ Вкладка закрыта: ID={tab_id}")
                         
+                        elif data.get("type") == "SUBSCRIBE_LOGS":
+                            await self._subscribe_logs(client, data.get("since"), data.get("maxQueue"))
+                        
+                        elif data.get("type") == "UNSUBSCRIBE_LOGS":
+                            self._unsubscribe_logs(client_id)
+                        
                         elif data.get("type") == "ERROR":
                             error_msg = data.get("message")
                             self.logger.error(f"[WS] ❌ Ошибка от расширения: {error_msg}")
                         
                         else:
-                            self.logger.debug(f"[WS] ⚠️ Неизвестный тип сообщения: {data.get('type')}")
+                            self.logger.debug("[WS] ⚠️ Неизвестный тип сообщения: %s", data.get('type'))
                     else:
-                        self.logger.debug(f"[WS] 📦 Получено (binary) от {client.profile_name or client_id}: {len(message)} bytes")
+                        self.logger.debug("[WS] 📦 Получено (binary) от %s: %d bytes", client.profile_name or client_id, len(message))
                 except json.JSONDecodeError as je:
                     self.logger.warn(f"[WS] ⚠️ Получено (не JSON) от {client.profile_name or client_id}: {message[:100]}")
                 except Exception as msg_error:
@@ -160,6 +172,7 @@ class WebSocketServer:
             self.logger.error(f"[WS] Traceback:\n{traceback.format_exc()}")
         finally:
             # Удаление клиента при отключении
+            self._unsubscribe_logs(client_id)
             self._clients.pop(client_id, None)
             self.logger.info(f"[WS] ➖ Клиент отключен: {client.profile_name or client_id}")
             self.logger.debug(f"[WS] Осталось подключенных клиентов: {len(self._clients)}")
@@ -173,6 +186,71 @@ class WebSocketServer:
                 except Exception as e:
                     self.logger.error(f"[WS] ❌ Ошибка в on_disconnect: {e}")
     
+    async def _subscribe_logs(self, client: Websocket_client, since: Optional[int] = None, max_queue: Optional[int] = None):
+        """
+        Подписывает клиента (дашборд) на живой поток логов.
+        Если передан since, сначала отправляется история после записи с этим номером (LOG_HISTORY).
+        reset: true в LOG_HISTORY означает, что since из другой нумерации (журнал перезапущен) и история
+        отправлена с начала; dropped - сколько записей после since уже вытеснено из истории.
+        Поток работает независимо от Plogging.set_websocket_settings: эти настройки определяют только,
+        какие уровни хранятся в истории. Записи уровней вне истории приходят с "seq": null.
+        """
+        self._unsubscribe_logs(client.client_id)
+        # Подписываемся до чтения истории, чтобы не потерять записи между ними
+        subscription = self.logger.subscribe(int(max_queue) if max_queue else LOG_STREAM_QUEUE_SIZE)
+        last_seq = -1
+        if since is not None:
+            since = int(since)
+            history = self.logger.log_history
+            reset = since > history.last_seq
+            dropped = max(0, history.first_seq - (0 if reset else since + 1))
+            entries, last_seq = self.logger.get_history_since(since)
+            await client.websocket.send(json.dumps({
+                "type": "LOG_HISTORY",
+                "records": [{"seq": seq, "msg": message} for seq, message in entries],
+                "lastSeq": last_seq,
+                "reset": reset,
+                "dropped": dropped,
+            }, ensure_ascii=False))
+        task = asyncio.create_task(self._log_stream_sender(client, subscription, last_seq))
+        self._log_streams[client.client_id] = (subscription, task)
+        self.logger.info(f"[WS] 📡 {client.profile_name or client.client_id} подписан на поток логов")
+
+    def _unsubscribe_logs(self, client_id: str):
+        stream = self._log_streams.pop(client_id, None)
+        if stream:
+            subscription, task = stream
+            subscription.close()
+            task.cancel()
+
+    async def _log_stream_sender(self, client: Websocket_client, subscription, last_seq: int):
+        """
+        Отправляет записи подписчику пачками. Медленный клиент задерживает только свою задачу:
+        писатель логов не ждет, а переполненная очередь подписки теряет самые старые записи.
+        Отправка идет напрямую в сокет, минуя Websocket_client.send, чтобы не порождать новые записи логов.
+        """
+        try:
+            while True:
+                records, dropped = await subscription.get(LOG_STREAM_BATCH_SIZE)
+                if subscription.closed:
+                    return
+                records = [record for record in records if record["seq"] is None or record["seq"] > last_seq]
+                if not records and not dropped:
+                    continue
+                await client.websocket.send(json.dumps({
+                    "type": "LOG_RECORDS",
+                    "records": records,
+                    "dropped": dropped,
+                }, ensure_ascii=False, default=str))
+        except asyncio.CancelledError:
+            raise
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.logger.error(f"[WS] ❌ Ошибка отправки логов {client.profile_name or client.client_id}: {e}")
+        finally:
+            subscription.close()
+
     async def start(self):
         """Запустить сервер"""
         if self._started:
@@ -214,7 +292,9 @@ class WebSocketServer:
         self.logger.info(f"[WS] 🛑 Остановка сервера...")
         self.logger.debug(f"[WS] Активных клиентов для отключения: {len(self._clients)}")
         
-        # Закрыть все соединения с клиентами
+        # Закрыть все подписки на логи и соединения с клиентами
+        for client_id in list(self._log_streams.keys()):
+            self._unsubscribe_logs(client_id)
         for client_id, client in list(self._clients.items()):
             try:
                 self.logger.debug(f"[WS] Закрытие соединения с {client.profile_name or client_id}")